@@ -0,0 +1,54 @@
+"""Bulk-enroll users from a manifest file or a zip archive.
+
+    python -m app.cli.enroll people/manifest.csv
+    python -m app.cli.enroll site-onboarding.zip --batch-size 1000 --report report.jsonl
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from app.config import configure_logging
+from app.database.connection import create_tables
+from app.services.enrollment_service import EnrollmentService, open_image_source
+from app.services.face_service import get_face_service
+from app.services.face_engine import shutdown_face_engine
+
+async def run(args: argparse.Namespace) -> int:
+    await create_tables()
+    source = open_image_source(args.source)
+    service = EnrollmentService(get_face_service())
+
+    started = time.monotonic()
+    summary = await service.enroll_source(source, batch_size=args.batch_size)
+    elapsed = time.monotonic() - started
+
+    if args.report:
+        with open(args.report, "w") as report:
+            for result in summary["results"]:
+                report.write(json.dumps(result) + "\n")
+    else:
+        for result in summary["results"]:
+            if result["errors"]:
+                print(json.dumps(result), file=sys.stderr)
+
+    rate = summary["enrolled"] / elapsed * 60 if elapsed > 0 else 0.0
+    print(f"Enrolled {summary['enrolled']}/{summary['total']} users "
+          f"({summary['failed']} failed) in {elapsed:.1f}s, {rate:.0f}/min")
+    return 0 if summary["failed"] == 0 else 1
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="manifest.csv / manifest.json, or a zip archive containing one")
+    parser.add_argument("--batch-size", type=int, default=None, help="users per encode/write chunk")
+    parser.add_argument("--report", help="write one JSON result per manifest entry to this file")
+    args = parser.parse_args()
+    configure_logging()
+    try:
+        exit_code = asyncio.run(run(args))
+    finally:
+        shutdown_face_engine()
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
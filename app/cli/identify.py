@@ -0,0 +1,65 @@
+"""Identify faces in archived video files and image directories.
+
+    python -m app.cli.identify /archive/cam1.mp4 /archive/photos --output results.jsonl
+    python -m app.cli.identify /archive --output results.parquet --fps 2
+
+Re-running the same command after an interruption resumes from the
+checkpoint written next to the output (``<output>.checkpoint.json``).
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from app.config import configure_logging
+from app.database.connection import create_tables
+from app.services.batch_identification import BatchIdentificationJob
+from app.services.face_service import get_face_service
+from app.services.face_engine import shutdown_face_engine
+
+async def run(args: argparse.Namespace) -> int:
+    await create_tables()
+    output_format = args.format or ("parquet" if args.output.rstrip("/").endswith(".parquet") else "jsonl")
+    job = BatchIdentificationJob(
+        get_face_service(),
+        args.sources,
+        args.output,
+        output_format=output_format,
+        checkpoint_path=args.checkpoint,
+        frame_step=args.every,
+        sample_fps=args.fps,
+        restart=args.restart
+    )
+
+    started = time.monotonic()
+    counts = await job.run()
+    elapsed = time.monotonic() - started
+
+    print(json.dumps(counts), file=sys.stderr)
+    print(f"Identified {counts['identified']}/{counts['faces']} faces in {counts['frames']} frames "
+          f"({counts['skipped']} skipped, {counts['errors']} errors) in {elapsed:.1f}s")
+    return 0 if counts["errors"] == 0 else 1
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="video files, image files or directories to walk")
+    parser.add_argument("--output", required=True, help="JSONL file, or a directory of Parquet part files")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), help="default: parquet if the output ends in .parquet")
+    parser.add_argument("--every", type=int, default=None, help="identify every Nth video frame")
+    parser.add_argument("--fps", type=float, default=None, help="sample this many frames per second of video instead")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <output>.checkpoint.json)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint and start over")
+    args = parser.parse_args()
+    configure_logging()
+    try:
+        exit_code = asyncio.run(run(args))
+    except (ValueError, OSError) as e:
+        # Bad arguments, unreadable sources or an unusable checkpoint/output
+        print(f"error: {e}", file=sys.stderr)
+        exit_code = 2
+    finally:
+        shutdown_face_engine()
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
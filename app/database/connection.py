@@ -1,19 +1,34 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from app.config import settings
+from app.database.vector_index import search_server_settings, ensure_vector_index, VECTOR_TABLES
+from app.database.vector_codec import register_vector_codec
 import asyncio
-from sqlalchemy import text
+import logging
+from sqlalchemy import event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+logger = logging.getLogger(__name__)
 
 class Base(DeclarativeBase):
     pass
 
 engine = create_async_engine(
     settings.database_url,
-    echo=settings.debug,
+    echo=settings.sql_echo,
     pool_size=20,
-    max_overflow=0
+    max_overflow=0,
+    connect_args={
+        "server_settings": search_server_settings(),
+        # Similarity queries have fixed SQL text, so they are parsed and planned once per connection
+        "prepared_statement_cache_size": settings.db_prepared_statement_cache_size
+    }
 )
 
+@event.listens_for(engine.sync_engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    dbapi_connection.run_async(register_vector_codec)
+
 async_session = async_sessionmaker(
     engine,
     class_=AsyncSession,
@@ -27,7 +42,63 @@ async def get_session() -> AsyncSession:
         finally:
             await session.close()
 
+async def warm_up_pool(connections: int = 0) -> int:
+    """Open up to ``connections`` pooled connections (0: the whole pool) ahead of the first requests.
+
+    Only connections nobody has checked out are warmed, and a pool timeout ends
+    the warm-up with a warning instead of failing it. Returns how many opened.
+    """
+    pool = engine.pool
+    connections = max(0, min(connections or pool.size(), pool.size() - pool.checkedout()))
+    opened = 0
+    all_open = asyncio.Event()
+    if connections == 0:
+        return 0
+
+    async def _open() -> None:
+        nonlocal opened
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                opened += 1
+                if opened == connections:
+                    all_open.set()
+                # Hold on until every connection is open, or the pool would just hand this one back
+                await all_open.wait()
+        finally:
+            all_open.set()
+
+    results = await asyncio.gather(*(_open() for _ in range(connections)), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for error in errors:
+        if not isinstance(error, PoolTimeoutError):
+            raise error
+    if errors:
+        logger.warning("Warmed %d of %d database connections; the rest of the pool is busy", opened, connections)
+    return opened
+
 async def create_tables():
     async with engine.begin() as conn:
         await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        # This connection may predate the extension; later ones get the codec on connect
+        raw_connection = await conn.get_raw_connection()
+        await register_vector_codec(raw_connection.driver_connection)
+        prototypes_existed = await conn.scalar(text("SELECT to_regclass('user_prototypes') IS NOT NULL"))
+        await conn.run_sync(Base.metadata.create_all)
+        if not prototypes_existed:
+            # Enrollment keeps prototypes current from then on, so only a new table needs filling
+            await backfill_prototypes(conn)
+        for table in VECTOR_TABLES:
+            await ensure_vector_index(conn, table)
+
+async def backfill_prototypes(conn) -> int:
+    """Build user prototypes for embeddings stored before the table existed; returns users added"""
+    result = await conn.execute(text("""
+        INSERT INTO user_prototypes (user_id, embedding, embedding_count)
+        SELECT fe.user_id, sum(fe.embedding), count(*)
+        FROM face_embeddings fe
+        WHERE NOT EXISTS (SELECT 1 FROM user_prototypes p WHERE p.user_id = fe.user_id)
+        GROUP BY fe.user_id
+        ON CONFLICT (user_id) DO NOTHING
+    """))
+    return result.rowcount
\ No newline at end of file
@@ -1,7 +1,7 @@
 from sqlalchemy import Column, Integer, String, JSON, DateTime, Text
 from sqlalchemy.sql import func
-from pgvector.sqlalchemy import Vector
 from app.database.connection import Base
+from app.database.vector_codec import BinaryVector
 import uuid
 
 class User(Base):
@@ -19,6 +19,16 @@ class FaceEmbedding(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, nullable=False, index=True)
-    embedding = Column(Vector(128), nullable=False)  # face_recognition produces 128-dim vectors
+    embedding = Column(BinaryVector(128), nullable=False)  # face_recognition produces 128-dim vectors
     face_metadata = Column(JSON, nullable=True)  # Changed from 'metadata' to 'face_metadata'
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class UserPrototype(Base):
+    __tablename__ = "user_prototypes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, unique=True, nullable=False, index=True)
+    # Sum of the user's embeddings: same direction as their mean, so cosine search treats it as the centroid
+    embedding = Column(BinaryVector(128), nullable=False)
+    embedding_count = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,9 +1,14 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, text
 from app.database.models import User, FaceEmbedding
+from app.config import settings
 from app.schemas.user_schemas import UserCreate, UserResponse
+from app.database.vector_codec import encode_vector
+from app.database.vector_index import candidate_count, candidate_order_sql
+from collections import defaultdict
 from typing import List, Optional, Tuple
 import numpy as np
+import json
 
 class UserRepository:
     def __init__(self, session: AsyncSession):
@@ -22,6 +27,58 @@ class UserRepository:
         )
         return result.scalar_one_or_none()
 
+# Adds embeddings to a user's prototype (their running sum), creating it for new users
+PROTOTYPE_UPSERT_SQL = """
+    INSERT INTO user_prototypes (user_id, embedding, embedding_count)
+    VALUES ({user_id}, {embedding}, {count})
+    ON CONFLICT (user_id) DO UPDATE SET
+        embedding = user_prototypes.embedding + EXCLUDED.embedding,
+        embedding_count = user_prototypes.embedding_count + EXCLUDED.embedding_count,
+        updated_at = now()
+"""
+
+def _nearest_sql(query: str) -> str:
+    """``(user_id, distance)`` of the ``:limit`` users nearest to the vector expression ``query``.
+
+    The candidate scan is served by the ANN index (on raw embeddings, or on user
+    prototypes when prototype search is on) and re-ranked on exact distances.
+    """
+    if settings.prototype_search:
+        # One prototype per user, so the candidates are distinct users; each is
+        # scored by its closest enrolled embedding
+        return f"""
+            SELECT p.user_id, best.distance
+            FROM (
+                SELECT user_id
+                FROM user_prototypes
+                ORDER BY {candidate_order_sql("embedding", query)}
+                LIMIT :candidates
+            ) p
+            CROSS JOIN LATERAL (
+                SELECT min(fe.embedding <=> {query}) AS distance
+                FROM face_embeddings fe
+                WHERE fe.user_id = p.user_id
+            ) best
+            ORDER BY best.distance
+            LIMIT :limit
+        """
+    return f"""
+        SELECT candidates.user_id, candidates.distance
+        FROM (
+            SELECT fe.user_id, fe.embedding <=> {query} AS distance
+            FROM face_embeddings fe
+            ORDER BY {candidate_order_sql("fe.embedding", query)}
+            LIMIT :candidates
+        ) candidates
+        ORDER BY candidates.distance
+        LIMIT :limit
+    """
+
+def _candidates(limit: int) -> int:
+    if settings.prototype_search:
+        return max(candidate_count(limit), settings.prototype_candidates)
+    return candidate_count(limit)
+
 class FaceEmbeddingRepository:
     def __init__(self, session: AsyncSession):
         self.session = session
@@ -29,38 +86,82 @@ class FaceEmbeddingRepository:
     async def create_embedding(self, user_id: str, embedding: np.ndarray, face_metadata: dict = None) -> FaceEmbedding:
         face_embedding = FaceEmbedding(
             user_id=user_id,
-            embedding=embedding.tolist(),
+            embedding=embedding,
             face_metadata=face_metadata  # Changed from metadata to face_metadata
         )
         self.session.add(face_embedding)
+        await self.session.execute(
+            text(PROTOTYPE_UPSERT_SQL.format(user_id=":user_id", embedding=":embedding", count="1")),
+            {"user_id": user_id, "embedding": np.asarray(embedding, dtype=np.float32)}
+        )
         await self.session.commit()
         await self.session.refresh(face_embedding)
         return face_embedding
     
     async def find_similar_faces(self, query_embedding: np.ndarray, threshold: float = 0.6, limit: int = 5) -> List[Tuple[str, float]]:
-        # query_vector = query_embedding.tolist()
-        query_embedding_str = self.numpy_to_pgvector(query_embedding)
-        
-        # Use cosine distance for similarity search
-        query = text("""
-            SELECT user_id, 1 - (embedding <=> :query_embedding) as similarity
-            FROM face_embeddings
-            WHERE 1 - (embedding <=> :query_embedding) > :threshold
-            ORDER BY embedding <=> :query_embedding
-            LIMIT :limit
+        # The inner ORDER BY ... LIMIT is what lets the HNSW/IVFFlat index serve the query;
+        # with a quantized index it fetches extra candidates that are re-ranked on the exact
+        # cosine distance of the full vectors, and the threshold is applied last
+        query = text(f"""
+            SELECT user_id, 1 - distance AS similarity
+            FROM ({_nearest_sql("CAST(:query_embedding AS vector)")}) nearest
+            WHERE distance < :max_distance
+            ORDER BY distance
         """)
         
         result = await self.session.execute(
             query,
             {
-                "query_embedding": query_embedding_str,
-                "threshold": threshold,
+                "query_embedding": np.asarray(query_embedding, dtype=np.float32),
+                "max_distance": 1 - threshold,
+                "candidates": _candidates(limit),
                 "limit": limit
             }
         )
         
         return [(row.user_id, row.similarity) for row in result.fetchall()]
     
+    async def find_similar_faces_batch(self, query_embeddings: List[np.ndarray], threshold: float = 0.6, limit: int = 5) -> List[List[dict]]:
+        """Resolve the top matches and their users for many embeddings in a single statement.
+
+        Returns one list of ``{user_id, name, phone_number, similarity}`` dicts per
+        query embedding, in input order.
+        """
+        if len(query_embeddings) == 0:
+            return []
+        
+        # Each query vector runs its own index-backed candidate scan via LATERAL, re-ranked
+        # on the exact distance; users are joined after the LIMIT so the join does not defeat the index
+        query = text(f"""
+            SELECT q.ord, nearest.user_id, u.name, u.phone_number, 1 - nearest.distance AS similarity
+            FROM unnest(CAST(:query_embeddings AS vector[])) WITH ORDINALITY AS q(embedding, ord)
+            CROSS JOIN LATERAL ({_nearest_sql("q.embedding")}) nearest
+            JOIN users u ON u.user_id = nearest.user_id
+            WHERE nearest.distance < :max_distance
+            ORDER BY q.ord, nearest.distance
+        """)
+        
+        result = await self.session.execute(
+            query,
+            {
+                # Pre-encoded elements: asyncpg would treat bare ndarrays as nested arrays
+                "query_embeddings": [encode_vector(embedding) for embedding in query_embeddings],
+                "max_distance": 1 - threshold,
+                "candidates": _candidates(limit),
+                "limit": limit
+            }
+        )
+        
+        matches = [[] for _ in query_embeddings]
+        for row in result.fetchall():
+            matches[row.ord - 1].append({
+                "user_id": row.user_id,
+                "name": row.name,
+                "phone_number": row.phone_number,
+                "similarity": row.similarity
+            })
+        return matches
+    
     async def get_all_embeddings_with_users(self) -> List[dict]:
         query = text("""
             SELECT fe.user_id, fe.embedding, u.name, u.phone_number
@@ -72,13 +173,65 @@ class FaceEmbeddingRepository:
         return [
             {
                 "user_id": row.user_id,
-                "embedding": row.embedding,
+                "embedding": row.embedding,  # already a float32 ndarray via the binary codec
                 "name": row.name,
                 "phone_number": row.phone_number
             }
             for row in result.fetchall()
         ]
 
-    def numpy_to_pgvector(self, embedding: np.ndarray) -> str:
-        """Convert a NumPy array to a pgvector-compatible string."""
-        return f"[{','.join(map(str, embedding))}]"
\ No newline at end of file
+    @staticmethod
+    def numpy_to_pgvector(embedding: np.ndarray) -> str:
+        """Convert a NumPy array to a pgvector text literal (e.g. for COPY text format)."""
+        return f"[{','.join(map(str, embedding))}]"
+
+    @staticmethod
+    def pgvector_to_numpy(value) -> np.ndarray:
+        """Convert a pgvector value (text literal or sequence) to a float32 NumPy array."""
+        if isinstance(value, str):
+            return np.array(value.strip("[]").split(","), dtype=np.float32)
+        return np.asarray(value, dtype=np.float32)
+
+class EnrollmentRepository:
+    """Bulk writes for enrolling many users at once"""
+    
+    def __init__(self, session: AsyncSession):
+        self.session = session
+    
+    async def bulk_create(self, users: List[dict], embeddings: List[dict]) -> None:
+        """Write users with COPY and their embeddings with one pipelined executemany, in one transaction.
+        
+        ``users`` need ``user_id``, ``name`` and ``phone_number``; ``embeddings`` need
+        ``user_id``, ``embedding`` and optionally ``face_metadata``.
+        """
+        connection = await self.session.connection()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+        
+        async with driver_connection.transaction():
+            await driver_connection.copy_records_to_table(
+                "users",
+                records=[(user["user_id"], user["name"], user["phone_number"]) for user in users],
+                columns=["user_id", "name", "phone_number"]
+            )
+            await driver_connection.executemany(
+                "INSERT INTO face_embeddings (user_id, embedding, face_metadata) VALUES ($1, $2, $3::json)",
+                [
+                    (
+                        row["user_id"],
+                        np.asarray(row["embedding"], dtype=np.float32),
+                        json.dumps(row["face_metadata"]) if row.get("face_metadata") is not None else None
+                    )
+                    for row in embeddings
+                ]
+            )
+            
+            prototypes = defaultdict(lambda: [np.zeros(128, dtype=np.float32), 0])
+            for row in embeddings:
+                prototype = prototypes[row["user_id"]]
+                prototype[0] += np.asarray(row["embedding"], dtype=np.float32)
+                prototype[1] += 1
+            await driver_connection.executemany(
+                PROTOTYPE_UPSERT_SQL.format(user_id="$1", embedding="$2", count="$3"),
+                [(user_id, total, count) for user_id, (total, count) in prototypes.items()]
+            )
\ No newline at end of file
@@ -0,0 +1,56 @@
+"""Binary wire format for pgvector columns on asyncpg connections.
+
+With the codec registered, query parameters are sent as packed float32 buffers
+and ``vector`` results come back as NumPy arrays, instead of being formatted
+into and parsed out of ``'[0.1,0.2,...]'`` text on both ends.
+"""
+import numpy as np
+from pgvector.sqlalchemy import Vector
+from pgvector.utils import from_db_binary, to_db_binary
+
+def encode_vector(value) -> bytes:
+    """ndarray, sequence or legacy text literal -> pgvector binary representation.
+
+    ``bytes`` are taken as already encoded (see ``encode_vector`` callers that
+    bind ``vector[]``: asyncpg would otherwise unpack each ndarray as a sub-array).
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    if isinstance(value, str):
+        value = value.strip("[]").split(",")
+    return to_db_binary(np.asarray(value, dtype=np.float32))
+
+def decode_vector(data: bytes) -> np.ndarray:
+    return from_db_binary(data)
+
+async def register_vector_codec(driver_connection) -> bool:
+    """Install the binary codec on a raw asyncpg connection.
+
+    Returns False when the ``vector`` type does not exist yet (fresh database
+    before ``CREATE EXTENSION``); ``create_tables`` registers it afterwards.
+    """
+    try:
+        await driver_connection.set_type_codec(
+            "vector",
+            encoder=encode_vector,
+            decoder=decode_vector,
+            format="binary"
+        )
+    except ValueError:
+        return False
+    return True
+
+class BinaryVector(Vector):
+    """``Vector`` column that hands arrays to the binary codec instead of formatting text"""
+
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        def process(value):
+            if value is None:
+                return None
+            value = np.asarray(value, dtype=np.float32)
+            if self.dim is not None and value.shape != (self.dim,):
+                raise ValueError(f"expected {self.dim} dimensions, not {value.shape}")
+            return value
+        return process
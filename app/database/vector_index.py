@@ -0,0 +1,242 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.config import settings
+from typing import Dict, Optional
+import asyncio
+import logging
+import math
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Every table with an ``embedding`` column gets an index named "<table>_embedding_idx"
+VECTOR_TABLES = ("face_embeddings", "user_prototypes")
+VECTOR_INDEX_METHODS = ("hnsw", "ivfflat")
+EMBEDDING_DIM = 128
+# pgvector's HNSW build parameters when an index was created without them
+HNSW_DEFAULTS = {"m": 16, "ef_construction": 64}
+
+# Compact representation -> (operator class, distance operator); "none" indexes the full vectors
+QUANTIZATIONS = {
+    "none": ("vector_cosine_ops", "<=>"),
+    "halfvec": ("halfvec_cosine_ops", "<=>"),
+    "binary": ("bit_hamming_ops", "<~>"),
+}
+
+_rebuild_lock = asyncio.Lock()
+
+def index_name(table: str) -> str:
+    return f"{table}_embedding_idx"
+
+def _rebuild_lock_key(table: str) -> int:
+    """Advisory lock id for rebuilds of ``table``, the same in every process and on every host"""
+    return zlib.crc32(f"vector_index_rebuild:{table}".encode())
+
+def recommended_ivfflat_lists(row_count: int) -> int:
+    """pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond that"""
+    if settings.ivfflat_lists > 0:
+        return settings.ivfflat_lists
+    if row_count <= 1_000_000:
+        return max(1, row_count // 1000)
+    return int(math.sqrt(row_count))
+
+def search_server_settings() -> Dict[str, str]:
+    """Per-session search parameters, sent when each pooled connection is opened"""
+    if settings.vector_index_type == "hnsw":
+        return {"hnsw.ef_search": str(settings.hnsw_ef_search)}
+    if settings.vector_index_type == "ivfflat":
+        return {"ivfflat.probes": str(settings.ivfflat_probes)}
+    return {}
+
+def quantized(expression: str) -> str:
+    """The configured compact form of a vector expression, as written in the index definition"""
+    if settings.vector_quantization == "halfvec":
+        return f"({expression})::halfvec({EMBEDDING_DIM})"
+    if settings.vector_quantization == "binary":
+        return f"binary_quantize({expression})::bit({EMBEDDING_DIM})"
+    return expression
+
+def candidate_order_sql(column: str, query: str) -> str:
+    """ORDER BY expression for the candidate scan; it matches the index expression so the index serves it"""
+    _, operator = QUANTIZATIONS[settings.vector_quantization]
+    return f"{quantized(column)} {operator} {quantized(query)}"
+
+def candidate_count(limit: int) -> int:
+    """Rows fetched from the index before the exact re-rank trims them to ``limit``"""
+    if settings.vector_quantization == "none":
+        return limit
+    return max(limit, settings.quantized_rerank_candidates)
+
+def _index_ddl(name: str, row_count: int, concurrently: bool = False, table: str = "face_embeddings") -> str:
+    """Build the CREATE INDEX statement for the configured index type"""
+    if settings.vector_index_type == "hnsw":
+        method = "hnsw"
+        options = f"m = {settings.hnsw_m}, ef_construction = {settings.hnsw_ef_construction}"
+    else:
+        method = "ivfflat"
+        options = f"lists = {recommended_ivfflat_lists(row_count)}"
+
+    opclass, _ = QUANTIZATIONS[settings.vector_quantization]
+    column = quantized("embedding")
+    if column != "embedding":
+        column = f"({column})"
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name} "
+        f"ON {table} USING {method} ({column} {opclass}) WITH ({options})"
+    )
+
+async def _count_rows(conn: AsyncConnection, table: str = "face_embeddings") -> int:
+    result = await conn.execute(text(f"SELECT count(*) FROM {table}"))
+    return result.scalar_one()
+
+async def get_vector_index_info(conn: AsyncConnection, table: str = "face_embeddings") -> Optional[dict]:
+    """Return method, operator class, build options and size of the existing index, or None if it is missing"""
+    result = await conn.execute(
+        text("""
+            SELECT am.amname AS method, c.reloptions AS options, opc.opcname AS opclass,
+                   pg_relation_size(c.oid) AS size_bytes
+            FROM pg_class c
+            JOIN pg_am am ON am.oid = c.relam
+            JOIN pg_index i ON i.indexrelid = c.oid
+            JOIN pg_opclass opc ON opc.oid = i.indclass[0]
+            WHERE c.relname = :name AND c.relkind = 'i'
+        """),
+        {"name": index_name(table)}
+    )
+    row = result.first()
+    if row is None:
+        return None
+
+    options = dict(option.split("=", 1) for option in (row.options or []))
+    return {
+        "name": index_name(table),
+        "method": row.method,
+        "opclass": row.opclass,
+        "size_bytes": row.size_bytes,
+        "lists": int(options["lists"]) if "lists" in options else None,
+        "m": int(options["m"]) if "m" in options else None,
+        "ef_construction": int(options["ef_construction"]) if "ef_construction" in options else None,
+    }
+
+def _is_stale(info: Optional[dict], row_count: int) -> bool:
+    """Missing, built with another method, quantization or HNSW parameters, or an IVFFlat list count that no longer fits the data"""
+    if settings.vector_index_type not in VECTOR_INDEX_METHODS:
+        return False
+    if settings.vector_index_type == "ivfflat" and row_count < settings.ivfflat_min_rows:
+        return False
+    if info is None or info["method"] != settings.vector_index_type:
+        return True
+    if info["opclass"] != QUANTIZATIONS[settings.vector_quantization][0]:
+        # Switching quantization migrates by rebuilding the index; the stored rows stay as they are
+        return True
+    if info["method"] == "hnsw":
+        configured = {"m": settings.hnsw_m, "ef_construction": settings.hnsw_ef_construction}
+        return any((info[option] or default) != configured[option] for option, default in HNSW_DEFAULTS.items())
+    if info["method"] == "ivfflat" and info["lists"]:
+        ideal = recommended_ivfflat_lists(row_count)
+        ratio = max(ideal, info["lists"]) / max(1, min(ideal, info["lists"]))
+        return ratio >= settings.ivfflat_rebuild_ratio
+    return False
+
+async def ensure_vector_index(conn: AsyncConnection, table: str = "face_embeddings") -> None:
+    """Create a missing ANN index at startup, if the table is small enough to index inline"""
+    if settings.vector_index_type not in VECTOR_INDEX_METHODS:
+        return
+
+    info = await get_vector_index_info(conn, table)
+    if info is not None:
+        if info["opclass"] != QUANTIZATIONS[settings.vector_quantization][0]:
+            logger.warning(
+                "Vector index uses %s but quantization %r is configured; "
+                "maintenance rebuilds it concurrently (or POST /api/vector_index/rebuild)",
+                info["opclass"], settings.vector_quantization
+            )
+        return
+
+    row_count = await _count_rows(conn, table)
+    if settings.vector_index_type == "ivfflat" and row_count < settings.ivfflat_min_rows:
+        # Lists trained on an (almost) empty table are useless; maintenance builds it later
+        logger.info("Skipping IVFFlat index on %s: %d rows < %d", table, row_count, settings.ivfflat_min_rows)
+        return
+    if row_count > settings.vector_index_startup_build_max_rows:
+        # A plain CREATE INDEX locks out writes for the whole build
+        logger.info("Deferring vector index on %s (%d rows) to a concurrent build by the maintenance task",
+                    table, row_count)
+        return
+
+    if settings.vector_index_maintenance_work_mem:
+        await conn.execute(text(f"SET LOCAL maintenance_work_mem = '{settings.vector_index_maintenance_work_mem}'"))
+    await conn.execute(text(_index_ddl(index_name(table), row_count, table=table)))
+
+async def rebuild_vector_index(table: str = "face_embeddings") -> Optional[dict]:
+    """Build a fresh index concurrently and swap it in without blocking writes.
+
+    Returns None without doing anything while another process (any worker or
+    host on the same database) is rebuilding the same table.
+    """
+    from app.database.connection import engine
+
+    async with _rebuild_lock:
+        name = index_name(table)
+        tmp_name = f"{name}_rebuild"
+        lock_key = _rebuild_lock_key(table)
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            # Session-level advisory lock: held across the autocommitted statements below
+            acquired = await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": lock_key})
+            if not acquired:
+                logger.info("Vector index on %s is being rebuilt by another process", table)
+                return None
+            try:
+                row_count = await _count_rows(conn, table)
+
+                if settings.vector_index_maintenance_work_mem:
+                    await conn.execute(text(f"SET maintenance_work_mem = '{settings.vector_index_maintenance_work_mem}'"))
+                # An interrupted concurrent build leaves an invalid index behind
+                await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {tmp_name}"))
+                await conn.execute(text(_index_ddl(tmp_name, row_count, concurrently=True, table=table)))
+                await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                await conn.execute(text(f"ALTER INDEX {tmp_name} RENAME TO {name}"))
+
+                info = await get_vector_index_info(conn, table)
+            finally:
+                if settings.vector_index_maintenance_work_mem:
+                    # The connection goes back to the pool; searches must not inherit the build setting
+                    await conn.execute(text("RESET maintenance_work_mem"))
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": lock_key})
+        logger.info("Rebuilt vector index on %s over %d rows: %s", table, row_count, info)
+        return info
+
+async def rebuild_vector_indexes() -> Dict[str, Optional[dict]]:
+    return {table: await rebuild_vector_index(table) for table in VECTOR_TABLES}
+
+async def maintain_vector_index() -> bool:
+    """Rebuild any index that is missing or stale; returns True if a rebuild ran"""
+    if settings.vector_index_type not in VECTOR_INDEX_METHODS or _rebuild_lock.locked():
+        return False
+
+    from app.database.connection import engine
+
+    rebuilt = False
+    for table in VECTOR_TABLES:
+        async with engine.connect() as conn:
+            info = await get_vector_index_info(conn, table)
+            row_count = await _count_rows(conn, table)
+
+        if _is_stale(info, row_count) and await rebuild_vector_index(table) is not None:
+            rebuilt = True
+    return rebuilt
+
+async def vector_index_maintenance_loop() -> None:
+    """Check the index at startup and then periodically (once with a 0 interval); meant to run as a background task"""
+    interval = settings.vector_index_maintenance_interval_seconds
+    while True:
+        try:
+            await maintain_vector_index()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Vector index maintenance error: %s", e)
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
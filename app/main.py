@@ -1,19 +1,32 @@
-from fastapi import FastAPI, File, UploadFile, Form, Depends, HTTPException, Request
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi import FastAPI, File, UploadFile, Form, Depends, HTTPException, Request, BackgroundTasks, WebSocket
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
-import cv2
 import asyncio
-from typing import Generator
-import numpy as np
+import logging
+import os
+import time
+import zipfile
+from typing import Any, AsyncGenerator, Dict, Optional
 
-from app.database.connection import get_session, create_tables
+from app.database.connection import get_session, create_tables, engine, warm_up_pool
+from app.database.vector_index import get_vector_index_info, rebuild_vector_indexes, vector_index_maintenance_loop
 from app.database.repositories import UserRepository, FaceEmbeddingRepository
-from app.services.face_service import FaceService
+from app.services.face_service import get_face_service
+from app.services.face_engine import face_engine_pending, shutdown_face_engine
 from app.services.detection_service import detection_service
-from app.schemas.user_schemas import UserCreate, UserResponse
-from app.config import settings
+from app.services.stream_hub import StreamHub, allowed_sources, display_name, resolve_source
+from app.services.frame_pipeline import LatestQueue
+from app.services.recognition_service import RecognitionService
+from app.services.enrollment_service import ArchiveTooLargeError, EnrollmentService, ZipImageSource
+from app.schemas.user_schemas import UserCreate, UserResponse, BulkEnrollmentResponse
+from app.metrics import registry
+from app.profiling import SamplingProfiler
+from app.config import settings, configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Facial Recognition App", version="1.0.0")
 
@@ -21,13 +34,101 @@ app = FastAPI(title="Facial Recognition App", version="1.0.0")
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/static")
 
-# Initialize services
-face_service = FaceService()
+# Initialize services; models and worker processes load on first use or during warm-up
+face_service = get_face_service()
+stream_hub = StreamHub(detection_service)
+recognition_service = RecognitionService(detection_service, face_service)
+profiler = SamplingProfiler(settings.profiler_interval_ms / 1000.0)
+readiness: Dict[str, Any] = {"ready": False, "warmup": {}}
+_background_tasks = set()
+
+def _register_gauges() -> None:
+    cache_stats = registry.per_scrape(detection_service.cache_service.stats)
+    registry.gauge(
+        "face_cache_entries", "Identities held in the recognition cache",
+        lambda: cache_stats()["size"]
+    )
+    registry.gauge(
+        "face_cache_requests", "Recognition cache lookups since startup by outcome",
+        lambda: {("hit",): cache_stats()["hits"], ("miss",): cache_stats()["misses"]},
+        ["result"]
+    )
+    registry.gauge(
+        "face_cache_hit_ratio", "Recognition cache hit ratio since startup",
+        lambda: cache_stats()["hit_rate"]
+    )
+    registry.gauge(
+        "face_recent_identities", "Recently matched embeddings held for reuse without a vector search",
+        detection_service.recent_identities.size
+    )
+    registry.gauge(
+        "face_engine_pending_tasks", "Detection/encoding jobs queued or running in the face engine",
+        face_engine_pending
+    )
+    registry.gauge(
+        "db_pool_connections", "Database connection pool usage",
+        lambda: {
+            ("checked_out",): engine.pool.checkedout(),
+            ("idle",): engine.pool.checkedin(),
+            ("overflow",): max(0, engine.pool.overflow()),
+            ("size",): engine.pool.size()
+        },
+        ["state"]
+    )
+    registry.gauge(
+        "stream_subscribers", "Viewers attached to each running video source (credentials masked)",
+        lambda: {(source,): stats["subscribers"] for source, stats in stream_hub.stats().items()},
+        ["source"]
+    )
+
+_register_gauges()
+
+def _start_background(coroutine) -> None:
+    task = asyncio.create_task(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def warm_up() -> None:
+    """Pay the cold-start costs before real traffic: engine workers, first dlib inference, DB connections"""
+    report = readiness["warmup"]
+    try:
+        started = time.monotonic()
+        report["face_engine_workers"] = await face_service.warm_up()
+        report["face_engine_seconds"] = round(time.monotonic() - started, 3)
+        
+        started = time.monotonic()
+        report["db_connections"] = await warm_up_pool(settings.warmup_db_connections)
+        report["db_seconds"] = round(time.monotonic() - started, 3)
+    except Exception as e:
+        logger.exception("Warm-up failed: %s", e)
+        report["error"] = str(e)
+        return
+    finally:
+        # Index builds hold a connection for minutes; start them once the pool is warm
+        _start_index_maintenance()
+    readiness["ready"] = True
+    logger.info("Warm-up finished: %s", report)
+
+def _start_index_maintenance() -> None:
+    if settings.vector_index_type != "none":
+        # Also builds indexes that create_tables left to a concurrent build
+        _start_background(vector_index_maintenance_loop())
 
 @app.on_event("startup")
 async def startup_event():
     await create_tables()
-    print("Application started successfully!")
+    await detection_service.load_gallery()
+    if settings.warmup_enabled:
+        _start_background(warm_up())
+    else:
+        _start_index_maintenance()
+        readiness["ready"] = True
+    logger.info("Application started successfully!")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stream_hub.stop_all()
+    shutdown_face_engine()
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -68,47 +169,179 @@ async def register_user(
             embedding=encoding,
             face_metadata={"face_info": face_info}
         )
+        detection_service.add_to_gallery(user.user_id, user.name, user.phone_number, encoding)
         
         return UserResponse.model_validate(user)
         
     except Exception as e:
-        print(f"Registration error: {e}")
+        logger.exception("Registration error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/register/bulk", response_model=BulkEnrollmentResponse)
+async def register_users_bulk(archive: UploadFile = File(...)):
+    """Enroll every user listed in the manifest.csv/manifest.json of a zip archive"""
+    def _open_archive() -> ZipImageSource:
+        archive.file.seek(0, os.SEEK_END)
+        size = archive.file.tell()
+        archive.file.seek(0)
+        if size > settings.enrollment_max_archive_bytes:
+            raise ArchiveTooLargeError(f"Archive is {size} bytes, the limit is {settings.enrollment_max_archive_bytes}")
+        return ZipImageSource(
+            zipfile.ZipFile(archive.file),
+            max_entries=settings.enrollment_max_archive_entries,
+            max_uncompressed_bytes=settings.enrollment_max_uncompressed_bytes
+        )
+
+    try:
+        # Reading the central directory is blocking file I/O
+        source = await asyncio.get_running_loop().run_in_executor(None, _open_archive)
+    except ArchiveTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (zipfile.BadZipFile, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    enrollment_service = EnrollmentService(
+        face_service,
+        on_enrolled=lambda user, encoding: detection_service.add_to_gallery(
+            user["user_id"], user["name"], user["phone_number"], encoding
+        )
+    )
+    try:
+        return await enrollment_service.enroll_source(source)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid manifest: {e}")
+
+@app.get("/api/vector_index")
+async def vector_index_info():
+    async with engine.connect() as conn:
+        info = await get_vector_index_info(conn)
+        prototype_info = await get_vector_index_info(conn, "user_prototypes")
+    return {
+        "configured": settings.vector_index_type,
+        "quantization": settings.vector_quantization,
+        "prototype_search": settings.prototype_search,
+        "index": info,
+        "prototype_index": prototype_info
+    }
+
+@app.post("/api/vector_index/rebuild", status_code=202)
+async def vector_index_rebuild(background_tasks: BackgroundTasks):
+    if settings.vector_index_type == "none":
+        raise HTTPException(status_code=400, detail="Vector index is disabled")
+    background_tasks.add_task(rebuild_vector_indexes)
+    return {"status": "scheduled", "configured": settings.vector_index_type}
+
+@app.get("/api/cache_stats")
+async def cache_stats():
+    stats = detection_service.cache_service.stats()
+    stats["recent_identities"] = detection_service.recent_identities.size()
+    shared = detection_service.recent_identities.shared
+    if shared is not None:
+        # Counting a shared backend walks the whole table or SCANs the server
+        stats["shared"] = shared.stats()
+        stats["shared"]["size"] = await asyncio.get_running_loop().run_in_executor(None, shared.size)
+    return stats
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once the startup warm-up has finished, 503 until then"""
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of stage latencies, drops, cache, engine and pool state"""
+    return registry.render()
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def debug_profile(seconds: float = 5.0):
+    """Sample every thread for ``seconds`` and return folded stacks for a flame graph"""
+    if not settings.profiler_enabled:
+        raise HTTPException(status_code=404, detail="Profiler is disabled")
+    seconds = min(max(seconds, 0.1), 60.0)
+    return await asyncio.get_running_loop().run_in_executor(None, profiler.sample, seconds)
+
 @app.get("/api/video_feed")
-async def video_feed():
-    async def generate_frames() -> Generator[bytes, None, None]:
-        cap = cv2.VideoCapture(0)
-        
-        if not cap.isOpened():
-            raise HTTPException(status_code=500, detail="Could not open camera")
-        
+async def video_feed(source: Optional[str] = None):
+    requested = source
+    source = resolve_source(requested) if requested is not None else allowed_sources()[0]
+    if source is None:
+        raise HTTPException(status_code=404, detail=f"Unknown video source {requested!r}")
+    
+    try:
+        queue = await stream_hub.subscribe(source)
+    except RuntimeError:
+        raise HTTPException(status_code=500, detail="Could not open camera")
+    
+    async def generate_frames() -> AsyncGenerator[bytes, None]:
         try:
             while True:
-                ret, frame = cap.read()
-                if not ret:
+                frame_bytes = await queue.get()
+                if frame_bytes is None:
                     break
-                
-                # Process frame through detection service
-                processed_frame = await detection_service.process_frame(frame)
-                
-                # Encode frame
-                _, buffer = cv2.imencode('.jpg', processed_frame)
-                frame_bytes = buffer.tobytes()
-                
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                
-                await asyncio.sleep(0.03)  # ~30 FPS
-                
         finally:
-            cap.release()
+            stream_hub.unsubscribe(source, queue)
     
     return StreamingResponse(
         generate_frames(),
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
 
+@app.websocket("/ws/recognize")
+async def recognize_ws(websocket: WebSocket, mode: str = "frame"):
+    """Clients send JPEG/PNG frames (``mode=frame``) or cropped faces (``mode=face``) as
+    binary messages and get ``{"frame", "faces", "dropped"}`` JSON back for each one processed.
+
+    Only the newest unprocessed message is kept, so a client sending faster than
+    it can be served sees dropped frames rather than growing latency.
+    """
+    if mode not in ("frame", "face"):
+        await websocket.close(code=1008, reason="mode must be 'frame' or 'face'")
+        return
+    await websocket.accept()
+    
+    frames = LatestQueue(name="websocket")
+    
+    async def receive_frames() -> None:
+        sequence = 0
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if not data or len(data) > settings.ws_max_frame_bytes:
+                    continue
+                sequence += 1
+                frames.put((sequence, data))
+        finally:
+            frames.put(None)
+    
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while True:
+            item = await frames.get()
+            if item is None:
+                break
+            sequence, data = item
+            try:
+                faces = await recognition_service.recognize(data, cropped=(mode == "face"))
+                response = {"frame": sequence, "faces": faces, "dropped": frames.dropped}
+            except ValueError as e:
+                response = {"frame": sequence, "faces": [], "dropped": frames.dropped, "error": str(e)}
+            await websocket.send_json(response)
+    except Exception as e:
+        # Client gone mid-send, or an unexpected failure: end this connection only
+        logger.debug("WebSocket recognition ended: %s", e)
+    finally:
+        receiver.cancel()
+        await asyncio.gather(receiver, return_exceptions=True)
+
+@app.get("/api/streams")
+async def streams():
+    return {"sources": [display_name(source) for source in allowed_sources()], "running": stream_hub.stats()}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""Lightweight in-process metrics rendered in the Prometheus text exposition format.
+
+Recording is a dict lookup plus a few additions under a per-metric lock, cheap
+enough for the per-frame path. Gauges that mirror state owned elsewhere (cache
+statistics, pool usage) are read through callbacks at scrape time only.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple, TypeVar, Union
+
+LabelValues = Tuple[str, ...]
+GaugeValue = Union[float, Dict[LabelValues, float]]
+T = TypeVar("T")
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _escape_label(value: str) -> str:
+    """Backslash, double quote and newline escaped, as the text exposition format requires"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            bucket_labels = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class CallbackGauge:
+    """Gauge whose value(s) are computed at scrape time"""
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], GaugeValue], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.callback()
+        except Exception:
+            return lines
+        values = value if isinstance(value, dict) else {(): value}
+        for labels, sample in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {float(sample)}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Union[Counter, Histogram, CallbackGauge]] = {}
+        self._scrapes = 0
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], GaugeValue],
+              labelnames: Sequence[str] = ()) -> CallbackGauge:
+        # Re-registering replaces the callback, e.g. when a service is recreated
+        gauge = CallbackGauge(name, help_text, callback, labelnames)
+        self._metrics[name] = gauge
+        return gauge
+
+    def per_scrape(self, callback: Callable[[], T]) -> Callable[[], T]:
+        """``callback`` memoised for the duration of one scrape, for several gauges read from one snapshot"""
+        memo: Dict[str, Any] = {"scrape": None}
+
+        def snapshot() -> T:
+            if memo["scrape"] != self._scrapes:
+                memo["value"] = callback()
+                memo["scrape"] = self._scrapes
+            return memo["value"]
+        return snapshot
+
+    def render(self) -> str:
+        self._scrapes += 1
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "face_stage_seconds",
+    "Latency of each recognition stage",
+    ["stage"]
+)
+FRAMES_DROPPED = registry.counter(
+    "face_frames_dropped_total",
+    "Frames discarded by latest-frame-wins queues",
+    ["queue"]
+)
+FACES_IDENTIFIED = registry.counter(
+    "face_identifications_total",
+    "Identification results by outcome",
+    ["result"]
+)
+FACES_SKIPPED = registry.counter(
+    "face_quality_skipped_total",
+    "Detected faces not encoded because they failed the quality gate, by reason",
+    ["reason"]
+)
+RECENT_IDENTITY_LOOKUPS = registry.counter(
+    "face_recent_identity_lookups_total",
+    "Embedding lookups in the recent-identity cache by outcome",
+    ["result"]
+)
+
+def stage_timer(stage: str):
+    """Context manager recording the duration of ``stage`` in face_stage_seconds"""
+    return STAGE_SECONDS.time(stage)
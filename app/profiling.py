@@ -0,0 +1,34 @@
+"""Optional sampling profiler for a running process.
+
+Samples the stacks of every thread at a fixed interval and returns them in the
+collapsed ("folded") format understood by flamegraph.pl and speedscope.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+class SamplingProfiler:
+    def __init__(self, interval_seconds: float = 0.005):
+        self.interval_seconds = interval_seconds
+        self._lock = threading.Lock()
+
+    def sample(self, seconds: float) -> str:
+        """Sample all threads for ``seconds`` (blocking) and return folded stacks"""
+        stacks = collections.Counter()
+        own_thread = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        with self._lock:
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                        frame = frame.f_back
+                    stacks[";".join(reversed(stack))] += 1
+                time.sleep(self.interval_seconds)
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class UserCreate(BaseModel):
@@ -20,4 +20,18 @@ class FaceDetectionResponse(BaseModel):
     name: Optional[str] = None
     phone_number: Optional[str] = None
     confidence: Optional[float] = None
-    bbox: Optional[list] = None
\ No newline at end of file
+    bbox: Optional[list] = None
+
+class EnrollmentItemResult(BaseModel):
+    index: int
+    name: Optional[str] = None
+    status: str  # "enrolled" or "failed"
+    user_id: Optional[str] = None
+    embeddings: int = 0
+    errors: List[str] = []
+
+class BulkEnrollmentResponse(BaseModel):
+    total: int
+    enrolled: int
+    failed: int
+    results: List[EnrollmentItemResult]
@@ -0,0 +1,374 @@
+"""Offline identification over archived video files and image directories.
+
+Work is split into tasks (a run of images, or a segment of a video) that the
+face engine's workers decode, detect and encode in parallel. Encodings from
+finished tasks are matched in batches, and one record per face is streamed to
+JSONL or Parquet. A checkpoint lists the finished tasks together with the
+output position they were written up to, so an interrupted job resumes where
+it stopped without duplicating or losing records.
+"""
+import asyncio
+import errno
+import functools
+import json
+import logging
+import os
+import time
+import numpy as np
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+from app.services.face_service import FaceService
+from app.services.matcher_service import EmbeddingMatcher
+from app.services.recent_identities import RecentIdentityCache
+from app.database.repositories import FaceEmbeddingRepository
+from app.database.connection import async_session
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v", ".mpg", ".mpeg")
+RECORD_FIELDS = ("source", "frame", "timestamp", "bbox", "user_id", "name", "confidence", "skipped", "error")
+CHECKPOINT_VERSION = 1
+
+class BatchTask(NamedTuple):
+    key: str
+    kind: str  # "images" or "video"
+    paths: Tuple[str, ...]
+    start: int = 0
+    stop: Optional[int] = None
+    step: int = 1
+
+def _record(source: str, **fields: Any) -> Dict[str, Any]:
+    record = dict.fromkeys(RECORD_FIELDS)
+    record["source"] = source
+    record.update(fields)
+    return record
+
+def discover_files(sources: List[str]) -> Iterator[str]:
+    """Image and video files under ``sources`` (files or directories), in a stable order"""
+    for source in sources:
+        if os.path.isfile(source):
+            yield source
+            continue
+        if not os.path.isdir(source):
+            raise FileNotFoundError(errno.ENOENT, "No such file or directory", source)
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS):
+                    yield os.path.join(root, name)
+
+def video_info(path: str) -> Tuple[Optional[int], float]:
+    """(frame count or None when the container does not say, frames per second)"""
+    import cv2
+
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            raise ValueError(f"Could not open video {path}")
+        count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        return (count if count > 0 else None), capture.get(cv2.CAP_PROP_FPS) or 0.0
+    finally:
+        capture.release()
+
+class JsonlResultWriter:
+    """Appends records as JSON lines; the position is the byte offset of the last flush"""
+
+    def __init__(self, path: str, position: int = 0):
+        self.path = path
+        if position and (not os.path.exists(path) or os.path.getsize(path) < position):
+            raise ValueError(f"{path} is missing or shorter than its checkpoint records; "
+                             f"start over with --restart (restart=True)")
+        self._file = open(path, "r+b" if position else "wb")
+        # Drop anything written after the checkpoint; those tasks are redone
+        self._file.seek(position)
+        self._file.truncate()
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        self._file.write("".join(json.dumps(record) + "\n" for record in records).encode())
+
+    def flush(self) -> int:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self) -> None:
+        self._file.close()
+
+class ParquetResultWriter:
+    """Writes a directory of Parquet part files, one per flush; the position is the part count"""
+
+    def __init__(self, path: str, position: int = 0):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)") from e
+        self._pa, self._pq = pa, pq
+        self.schema = pa.schema([
+            ("source", pa.string()), ("frame", pa.int64()), ("timestamp", pa.float64()),
+            ("bbox", pa.list_(pa.int32())), ("user_id", pa.string()), ("name", pa.string()),
+            ("confidence", pa.float64()), ("skipped", pa.string()), ("error", pa.string()),
+        ])
+        self.path = path
+        self.parts = position
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            # Parts written after the checkpoint belong to tasks that are redone
+            if name.startswith("part-") and name.endswith(".parquet") and int(name[5:-8]) >= position:
+                os.remove(os.path.join(path, name))
+        self._buffer: List[Dict[str, Any]] = []
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        self._buffer.extend(records)
+
+    def flush(self) -> int:
+        if self._buffer:
+            table = self._pa.Table.from_pylist(self._buffer, schema=self.schema)
+            part = os.path.join(self.path, f"part-{self.parts:05d}.parquet")
+            self._pq.write_table(table, part + ".tmp")
+            os.replace(part + ".tmp", part)
+            self.parts += 1
+            self._buffer = []
+        return self.parts
+
+    def close(self) -> None:
+        self.flush()
+
+def open_result_writer(path: str, output_format: str, position: int = 0):
+    if output_format == "parquet":
+        return ParquetResultWriter(path, position)
+    if output_format == "jsonl":
+        return JsonlResultWriter(path, position)
+    raise ValueError(f"Unknown output format {output_format!r}")
+
+class BatchIdentificationJob:
+    """Identify every face in ``sources`` and stream the results to ``output``.
+
+    ``frame_step`` samples video frames; ``sample_fps`` overrides it per video
+    from the video's own frame rate.
+    """
+
+    def __init__(self, face_service: FaceService, sources: List[str], output: str,
+                 output_format: str = "jsonl", checkpoint_path: Optional[str] = None,
+                 frame_step: Optional[int] = None, sample_fps: Optional[float] = None,
+                 restart: bool = False):
+        self.face_service = face_service
+        self.sources = [os.path.abspath(source) for source in sources]
+        self.output = output
+        self.output_format = output_format
+        self.checkpoint_path = checkpoint_path or f"{output.rstrip(os.sep)}.checkpoint.json"
+        self.frame_step = max(1, frame_step or settings.batch_frame_step)
+        self.sample_fps = sample_fps
+        self.restart = restart
+        self.matcher: Optional[EmbeddingMatcher] = None
+        self.recent_identities = RecentIdentityCache(
+            max_size=settings.recent_identity_max_size,
+            ttl_seconds=settings.recent_identity_ttl_seconds,
+            tolerance=settings.recent_identity_tolerance
+        )
+        self.done: Set[str] = set()
+        self.counts = {"tasks": 0, "frames": 0, "faces": 0, "identified": 0, "skipped": 0, "errors": 0}
+
+    # Checkpoint -------------------------------------------------------------
+
+    def _load_checkpoint(self) -> int:
+        """Restore finished tasks and counters; returns the output position to resume from"""
+        if self.restart or not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("version") != CHECKPOINT_VERSION or checkpoint.get("format") != self.output_format:
+            raise ValueError(f"{self.checkpoint_path} was written by an incompatible job; start over with --restart (restart=True)")
+        if checkpoint.get("sources") != self.sources:
+            raise ValueError(f"{self.checkpoint_path} was written for other sources; start over with --restart (restart=True)")
+        self.done = set(checkpoint["done"])
+        self.counts.update(checkpoint["counts"])
+        logger.info("Resuming from %s: %d tasks already done", self.checkpoint_path, len(self.done))
+        return checkpoint["position"]
+
+    def _save_checkpoint(self, writer, finished: List[str]) -> None:
+        # Output first: the checkpoint must never claim records that are not on disk
+        position = writer.flush()
+        self.done.update(finished)
+        finished.clear()
+        checkpoint = {
+            "version": CHECKPOINT_VERSION,
+            "format": self.output_format,
+            "sources": self.sources,
+            "position": position,
+            "done": sorted(self.done),
+            "counts": self.counts,
+        }
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # Work -------------------------------------------------------------------
+
+    def tasks(self) -> Iterator[BatchTask]:
+        """Every task of the job, finished ones included, in a stable order"""
+        images: List[str] = []
+
+        def image_task() -> BatchTask:
+            task = BatchTask(f"images:{images[0]}:{len(images)}", "images", tuple(images))
+            images.clear()
+            return task
+
+        for path in discover_files(self.sources):
+            if not path.lower().endswith(VIDEO_EXTENSIONS):
+                images.append(path)
+                if len(images) >= settings.batch_images_per_task:
+                    yield image_task()
+                continue
+            try:
+                frame_count, fps = video_info(path)
+            except ValueError:
+                # The worker fails the same way and the error is reported in the output
+                frame_count, fps = None, 0.0
+            step = self.frame_step
+            if self.sample_fps and fps:
+                step = max(1, int(round(fps / self.sample_fps)))
+            if frame_count is None:
+                yield BatchTask(f"video:{path}:0", "video", (path,), step=step)
+                continue
+            segment = max(1, settings.batch_video_segment_frames)
+            for start in range(0, frame_count, segment):
+                # The frame count is only the container's estimate; the last segment reads to the end
+                stop = start + segment if start + segment < frame_count else None
+                yield BatchTask(f"video:{path}:{start}", "video", (path,), start, stop, step)
+        if images:
+            yield image_task()
+
+    async def _analyze(self, task: BatchTask) -> Tuple[List[Tuple[Dict[str, Any], Optional[np.ndarray]]], int]:
+        """Records for one task, each paired with the encoding still to be matched (or None), and the frame count"""
+        faces_per_frame: List[Tuple[str, Optional[int], Optional[float], list, Optional[str]]] = []
+        try:
+            if task.kind == "images":
+                results = await self.face_service.analyze_image_files(list(task.paths))
+                faces_per_frame = [(path, None, None, faces, error) for path, (faces, error) in zip(task.paths, results)]
+            else:
+                path = task.paths[0]
+                frames = await self.face_service.analyze_video_segment(path, task.start, task.stop, task.step)
+                faces_per_frame = [(path, index, timestamp, faces, None) for index, timestamp, faces in frames]
+        except Exception as e:
+            logger.exception("Batch task %s failed: %s", task.key, e)
+            faces_per_frame = [(path, None, None, [], str(e)) for path in task.paths]
+
+        pairs: List[Tuple[Dict[str, Any], Optional[np.ndarray]]] = []
+        for source, frame, timestamp, faces, error in faces_per_frame:
+            if error is not None:
+                pairs.append((_record(source, frame=frame, timestamp=timestamp, error=error), None))
+                continue
+            for bbox, encoding, reason in faces:
+                record = _record(source, frame=frame, timestamp=timestamp, bbox=[int(v) for v in bbox],
+                                 name="Unknown", confidence=0.0, skipped=reason)
+                pairs.append((record, encoding))
+        return pairs, len(faces_per_frame)
+
+    async def _search(self, encodings: List[np.ndarray]) -> List[Optional[Dict[str, Any]]]:
+        if self.matcher is not None:
+            results = await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(self.matcher.match, encodings, threshold=settings.face_recognition_tolerance, limit=1)
+            )
+            return [candidates[0] if candidates else None for candidates in results]
+        async with async_session() as session:
+            results = await FaceEmbeddingRepository(session).find_similar_faces_batch(
+                encodings, threshold=settings.face_recognition_tolerance, limit=1
+            )
+        return [candidates[0] if candidates else None for candidates in results]
+
+    async def _identify(self, pairs: List[Tuple[Dict[str, Any], Optional[np.ndarray]]]) -> None:
+        """Fill in identities for every record with an encoding, in lookup batches"""
+        to_match = [(record, encoding) for record, encoding in pairs if encoding is not None]
+        for start in range(0, len(to_match), settings.batch_lookup_size):
+            chunk = to_match[start:start + settings.batch_lookup_size]
+            encodings = [encoding for _, encoding in chunk]
+            matches = self.recent_identities.lookup(encodings)
+            misses = [i for i, match in enumerate(matches) if match is None]
+            if misses:
+                searched = await self._search([encodings[i] for i in misses])
+                self.recent_identities.remember([encodings[i] for i in misses], searched)
+                for i, match in zip(misses, searched):
+                    matches[i] = match
+            for (record, _), match in zip(chunk, matches):
+                if match is not None:
+                    record.update(user_id=match["user_id"], name=match["name"], confidence=float(match["similarity"]))
+
+    async def run(self) -> Dict[str, Any]:
+        """Process every unfinished task; returns the job's cumulative counters"""
+        position = self._load_checkpoint()
+        if settings.matcher_backend == "memory":
+            self.matcher = EmbeddingMatcher()
+            async with async_session() as session:
+                count = await self.matcher.load(session)
+            logger.info("Loaded %d embeddings into the in-memory matcher", count)
+
+        writer = open_result_writer(self.output, self.output_format, position)
+        max_in_flight = self.face_service.engine.workers * 2
+        pending: List[Tuple[str, List[Tuple[Dict[str, Any], Optional[np.ndarray]]], int]] = []
+        pending_encodings = 0
+        written: List[str] = []  # written since the last checkpoint
+        last_checkpoint = time.monotonic()
+        tasks = (task for task in self.tasks() if task.key not in self.done)
+        in_flight: Set[asyncio.Task] = set()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(in_flight) < max_in_flight:
+                    task = next(tasks, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    in_flight.add(asyncio.ensure_future(self._keyed(task)))
+                if in_flight:
+                    finished, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for future in finished:
+                        key, (pairs, frames) = future.result()
+                        pending.append((key, pairs, frames))
+                        pending_encodings += sum(1 for _, encoding in pairs if encoding is not None)
+
+                idle = exhausted and not in_flight
+                if pending and (pending_encodings >= settings.batch_lookup_size or idle):
+                    await self._identify([pair for _, pairs, _ in pending for pair in pairs])
+                    records = [record for _, pairs, _ in pending for record, _ in pairs]
+                    writer.write(records)
+                    written.extend(key for key, _, _ in pending)
+                    self._count(records, len(pending), sum(frames for _, _, frames in pending))
+                    pending, pending_encodings = [], 0
+
+                if idle or time.monotonic() - last_checkpoint >= settings.batch_checkpoint_interval_seconds:
+                    self._save_checkpoint(writer, written)
+                    last_checkpoint = time.monotonic()
+                    logger.info(
+                        "Batch identification: %d tasks, %d frames, %d faces (%d identified, %d skipped)",
+                        self.counts["tasks"], self.counts["frames"], self.counts["faces"],
+                        self.counts["identified"], self.counts["skipped"]
+                    )
+                if idle:
+                    break
+        finally:
+            for future in in_flight:
+                future.cancel()
+            writer.close()
+        return dict(self.counts)
+
+    async def _keyed(self, task: BatchTask) -> Tuple[str, Tuple[List[Tuple[Dict[str, Any], Optional[np.ndarray]]], int]]:
+        return task.key, await self._analyze(task)
+
+    def _count(self, records: List[Dict[str, Any]], tasks: int, frames: int) -> None:
+        """Counters only cover written records, so they stay consistent with the checkpoint"""
+        self.counts["tasks"] += tasks
+        self.counts["frames"] += frames
+        for record in records:
+            if record["error"] is not None:
+                self.counts["errors"] += 1
+                continue
+            self.counts["faces"] += 1
+            if record["skipped"] is not None:
+                self.counts["skipped"] += 1
+            elif record["user_id"] is not None:
+                self.counts["identified"] += 1
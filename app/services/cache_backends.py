@@ -0,0 +1,516 @@
+"""Storage backends for ``CacheService``.
+
+``MemoryCacheBackend`` keeps Python objects in this process. The shared
+backends store bytes (``binary = True``) so one cache can serve every uvicorn
+worker: ``SharedMemoryCacheBackend`` on one host through an mmap'd file, and
+``RespCacheBackend`` through any server speaking the Redis protocol.
+"""
+import fcntl
+import hashlib
+import heapq
+import logging
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+class CacheBackend:
+    """Key/value store with per-entry TTL; missing and expired keys read as None"""
+
+    name = "base"
+    binary = False  # True when values must be bytes
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def sweep(self) -> None:
+        """Drop expired entries now; backends that expire on their own may ignore this"""
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def size(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters; includes ``size`` only where it is cheap to get"""
+        raise NotImplementedError
+
+class _CacheShard:
+    """One LRU partition with its own lock.
+
+    ``entries`` is kept in recency order for LRU eviction. ``expiry`` is a heap
+    of ``(expires_at, key)``, so sweeping only touches entries that have
+    actually expired whatever TTL each was given. Entries deleted, evicted or
+    overwritten leave stale heap items behind; those are skipped when popped
+    and dropped whenever the heap outgrows twice the shard's capacity.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self.expiry: List[Tuple[float, str]] = []
+        self.lock = threading.Lock()
+        self.last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def remove(self, key: str) -> None:
+        del self.entries[key]
+
+    def put(self, key: str, value: Any, expires_at: float) -> None:
+        self.entries[key] = (value, expires_at)
+        heapq.heappush(self.expiry, (expires_at, key))
+        if len(self.expiry) > 2 * self.max_size:
+            self.expiry = [(entry_expires_at, entry_key) for entry_key, (_, entry_expires_at) in self.entries.items()]
+            heapq.heapify(self.expiry)
+
+    def sweep(self, now: float) -> None:
+        while self.expiry and self.expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self.expiry)
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] == expires_at:
+                self.remove(key)
+                self.expirations += 1
+        self.last_sweep = now
+
+class MemoryCacheBackend(CacheBackend):
+    """Sharded in-process LRU holding Python objects as they are"""
+
+    name = "memory"
+
+    def __init__(self, max_size: int = 1000, num_shards: int = 1, sweep_interval_seconds: int = 60):
+        self.max_size = max_size
+        self.sweep_interval_seconds = sweep_interval_seconds
+        num_shards = max(1, num_shards)
+        shard_size = max(1, -(-max_size // num_shards))
+        self._shards = [_CacheShard(shard_size) for _ in range(num_shards)]
+
+    def _shard(self, key: str) -> _CacheShard:
+        if len(self._shards) == 1:
+            return self._shards[0]
+        return self._shards[hash(key) % len(self._shards)]
+
+    def get(self, key: str) -> Optional[Any]:
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is None:
+                shard.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                # Lazy expiry
+                shard.remove(key)
+                shard.expirations += 1
+                shard.misses += 1
+                return None
+            shard.entries.move_to_end(key)
+            shard.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        shard = self._shard(key)
+        now = time.monotonic()
+        with shard.lock:
+            if now - shard.last_sweep >= self.sweep_interval_seconds:
+                shard.sweep(now)
+            if key in shard.entries:
+                shard.remove(key)
+            elif len(shard.entries) >= shard.max_size:
+                # Evict the least recently used entry
+                oldest_key = next(iter(shard.entries))
+                shard.remove(oldest_key)
+                shard.evictions += 1
+            shard.put(key, value, now + ttl_seconds)
+
+    def delete(self, key: str) -> None:
+        shard = self._shard(key)
+        with shard.lock:
+            if key in shard.entries:
+                shard.remove(key)
+
+    def sweep(self) -> None:
+        now = time.monotonic()
+        for shard in self._shards:
+            with shard.lock:
+                shard.sweep(now)
+
+    def clear(self) -> None:
+        for shard in self._shards:
+            with shard.lock:
+                shard.entries.clear()
+                shard.expiry = []
+
+    def size(self) -> int:
+        return sum(len(shard.entries) for shard in self._shards)
+
+    def stats(self) -> Dict[str, Any]:
+        totals = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "size": 0}
+        for shard in self._shards:
+            with shard.lock:
+                totals["hits"] += shard.hits
+                totals["misses"] += shard.misses
+                totals["evictions"] += shard.evictions
+                totals["expirations"] += shard.expirations
+                totals["size"] += len(shard.entries)
+        totals["max_size"] = self.max_size
+        totals["shards"] = len(self._shards)
+        return totals
+
+def _stable_hash(key: bytes) -> int:
+    """Same value in every process, unlike ``hash()``; never 0"""
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+class SharedMemoryCacheBackend(CacheBackend):
+    """Set-associative hash table in an mmap'd file, shared by every process on the host.
+
+    Each key hashes to a set of ``WAYS`` fixed-size slots; a full set evicts its
+    least recently used slot. Sets are locked with ``fcntl`` byte-range locks
+    (between processes) plus a thread lock (within this process). Expiry uses
+    ``time.monotonic()``, which is CLOCK_MONOTONIC and so agrees across processes.
+    Hit/miss counters are per process.
+    """
+
+    name = "shm"
+    binary = True
+    MAGIC = b"FRCACHE1"
+    WAYS = 8
+    HEADER = struct.Struct("<8sII")  # magic, sets, slot bytes
+    HEADER_BYTES = 64
+    SLOT = struct.Struct("<QddHH")  # key hash, expires at, last used, key length, value length
+
+    def __init__(self, path: str, max_size: int = 1000, slot_bytes: int = 512):
+        self.path = path
+        self.max_size = max_size
+        self.slot_bytes = slot_bytes
+        self.sets = max(1, -(-max_size // self.WAYS))
+        self._set_bytes = self.WAYS * slot_bytes
+        total = self.HEADER_BYTES + self.sets * self._set_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.oversized = 0
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # The first process to arrive sizes and formats the file; the rest just map it.
+        # A file with another layout may be mapped by running workers, so it is never
+        # resized or reformatted in place.
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self.HEADER_BYTES, 0)
+        try:
+            existing = os.fstat(self._fd).st_size
+            if existing == 0:
+                os.ftruncate(self._fd, total)
+            elif existing != total:
+                raise ValueError(self._layout_error(f"{existing} bytes, expected {total}"))
+            self._map = mmap.mmap(self._fd, total)
+            magic, sets, stored_slot_bytes = self.HEADER.unpack_from(self._map, 0)
+            if magic == bytes(len(self.MAGIC)):
+                # Sized by a process that died before formatting it
+                self._format()
+            elif (magic, sets, stored_slot_bytes) != (self.MAGIC, self.sets, slot_bytes):
+                self._map.close()
+                raise ValueError(self._layout_error(f"{sets} sets of {stored_slot_bytes}-byte slots, "
+                                                    f"expected {self.sets} of {slot_bytes}"))
+        except BaseException:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, self.HEADER_BYTES, 0)
+            os.close(self._fd)
+            raise
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, self.HEADER_BYTES, 0)
+
+    def _layout_error(self, detail: str) -> str:
+        return (f"Shared cache {self.path} has another layout ({detail}); stop every worker using it "
+                f"and delete it, or set CACHE_SHM_PATH to a new file")
+
+    def _format(self) -> None:
+        empty = bytes(self._set_bytes)
+        for index in range(self.sets):
+            offset = self.HEADER_BYTES + index * self._set_bytes
+            self._map[offset:offset + self._set_bytes] = empty
+        self.HEADER.pack_into(self._map, 0, self.MAGIC, self.sets, self.slot_bytes)
+
+    @contextmanager
+    def _locked_set(self, index: int) -> Iterator[int]:
+        offset = self.HEADER_BYTES + index * self._set_bytes
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self._set_bytes, offset)
+            try:
+                yield offset
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self._set_bytes, offset)
+
+    def _find(self, offset: int, key_hash: int, key: bytes) -> Optional[Tuple[int, tuple]]:
+        for way in range(self.WAYS):
+            slot = offset + way * self.slot_bytes
+            header = self.SLOT.unpack_from(self._map, slot)
+            if header[0] == key_hash and header[3] == len(key):
+                start = slot + self.SLOT.size
+                if self._map[start:start + len(key)] == key:
+                    return slot, header
+        return None
+
+    def get(self, key: str) -> Optional[bytes]:
+        raw_key = key.encode()
+        key_hash = _stable_hash(raw_key)
+        now = time.monotonic()
+        with self._locked_set(key_hash % self.sets) as offset:
+            found = self._find(offset, key_hash, raw_key)
+            if found is None:
+                self.misses += 1
+                return None
+            slot, (_, expires_at, _, key_length, value_length) = found
+            if expires_at <= now:
+                self.SLOT.pack_into(self._map, slot, 0, 0.0, 0.0, 0, 0)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.SLOT.pack_into(self._map, slot, key_hash, expires_at, now, key_length, value_length)
+            start = slot + self.SLOT.size + key_length
+            self.hits += 1
+            return bytes(self._map[start:start + value_length])
+
+    def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        raw_key = key.encode()
+        if self.SLOT.size + len(raw_key) + len(value) > self.slot_bytes:
+            self.oversized += 1
+            return
+        key_hash = _stable_hash(raw_key)
+        now = time.monotonic()
+        with self._locked_set(key_hash % self.sets) as offset:
+            found = self._find(offset, key_hash, raw_key)
+            if found is not None:
+                slot = found[0]
+            else:
+                # Prefer an empty or expired slot, otherwise evict the least recently used
+                slot, oldest = None, None
+                for way in range(self.WAYS):
+                    candidate = offset + way * self.slot_bytes
+                    _, expires_at, last_used, key_length, _ = self.SLOT.unpack_from(self._map, candidate)
+                    if key_length == 0 or expires_at <= now:
+                        slot = candidate
+                        break
+                    if oldest is None or last_used < oldest:
+                        slot, oldest = candidate, last_used
+                else:
+                    self.evictions += 1
+            start = slot + self.SLOT.size
+            self._map[start:start + len(raw_key)] = raw_key
+            self._map[start + len(raw_key):start + len(raw_key) + len(value)] = value
+            self.SLOT.pack_into(self._map, slot, key_hash, now + ttl_seconds, now, len(raw_key), len(value))
+
+    def delete(self, key: str) -> None:
+        raw_key = key.encode()
+        key_hash = _stable_hash(raw_key)
+        with self._locked_set(key_hash % self.sets) as offset:
+            found = self._find(offset, key_hash, raw_key)
+            if found is not None:
+                self.SLOT.pack_into(self._map, found[0], 0, 0.0, 0.0, 0, 0)
+
+    def _scan(self, clear_expired: bool, clear_all: bool = False) -> int:
+        live = 0
+        now = time.monotonic()
+        for index in range(self.sets):
+            with self._locked_set(index) as offset:
+                for way in range(self.WAYS):
+                    slot = offset + way * self.slot_bytes
+                    _, expires_at, _, key_length, _ = self.SLOT.unpack_from(self._map, slot)
+                    if key_length == 0:
+                        continue
+                    if clear_all or (clear_expired and expires_at <= now):
+                        self.SLOT.pack_into(self._map, slot, 0, 0.0, 0.0, 0, 0)
+                    elif expires_at > now:
+                        live += 1
+        return live
+
+    def sweep(self) -> None:
+        self._scan(clear_expired=True)
+
+    def clear(self) -> None:
+        self._scan(clear_expired=False, clear_all=True)
+
+    def size(self) -> int:
+        return self._scan(clear_expired=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "oversized": self.oversized,
+            "max_size": self.sets * self.WAYS,
+            "shards": self.sets,
+        }
+
+class RespError(Exception):
+    pass
+
+class RespCacheBackend(CacheBackend):
+    """Minimal client for a Redis-protocol (RESP) server, e.g. Redis, Valkey or KeyDB.
+
+    Calls block, so async callers run them in a thread. A failing server reads
+    as a cache miss instead of failing recognition: after an error the circuit
+    opens and calls return at once without touching the network until a retry
+    is due, with the wait doubling per failed retry up to ``max_retry_seconds``.
+    The server's own maxmemory policy bounds the size, not ``max_size``.
+    """
+
+    name = "redis"
+    binary = True
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "face:", timeout_seconds: float = 0.05,
+                 retry_seconds: float = 1.0, max_retry_seconds: float = 30.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.prefix = prefix
+        self.timeout_seconds = timeout_seconds
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self._backoff = retry_seconds
+        self._retry_at = 0.0  # the circuit is open until then
+        self._socket: Optional[socket.socket] = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _connect(self) -> None:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout_seconds)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket = sock
+        self._reader = sock.makefile("rb")
+        if self.password:
+            self._roundtrip(b"AUTH", self.password.encode())
+        if self.db:
+            self._roundtrip(b"SELECT", str(self.db).encode())
+
+    def _close(self) -> None:
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+        self._reader = None
+
+    def _roundtrip(self, *args: bytes) -> Any:
+        payload = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            payload.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self._socket.sendall(b"".join(payload))
+        return self._read_reply()
+
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("connection closed by server")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body
+        if kind == b"-":
+            raise RespError(body.decode(errors="replace"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(body)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise RespError(f"unexpected reply {line!r}")
+
+    def _command(self, *args: bytes) -> Any:
+        with self._lock:
+            if self.circuit_open:
+                return None
+            try:
+                if self._socket is None:
+                    self._connect()
+                reply = self._roundtrip(*args)
+            except (OSError, ConnectionError, RespError) as e:
+                self.errors += 1
+                self._close()
+                self._retry_at = time.monotonic() + self._backoff
+                logger.warning("Cache server %s:%d unavailable, retrying in %.1fs: %s",
+                               self.host, self.port, self._backoff, e)
+                self._backoff = min(self._backoff * 2, self.max_retry_seconds)
+                return None
+            self._backoff = self.retry_seconds
+            return reply
+
+    @property
+    def circuit_open(self) -> bool:
+        return self._socket is None and time.monotonic() < self._retry_at
+
+    def _key(self, key: str) -> bytes:
+        return (self.prefix + key).encode()
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self._command(b"GET", self._key(key))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        self._command(b"SET", self._key(key), value, b"PX", str(max(1, int(ttl_seconds * 1000))).encode())
+
+    def delete(self, key: str) -> None:
+        self._command(b"DEL", self._key(key))
+
+    def _keys(self) -> List[bytes]:
+        keys, cursor = [], b"0"
+        while True:
+            reply = self._command(b"SCAN", cursor, b"MATCH", self.prefix.encode() + b"*", b"COUNT", b"1000")
+            if not reply:
+                return keys
+            cursor, batch = reply
+            keys.extend(batch)
+            if cursor == b"0":
+                return keys
+
+    def clear(self) -> None:
+        keys = self._keys()
+        for start in range(0, len(keys), 500):
+            self._command(b"DEL", *keys[start:start + 500])
+
+    def size(self) -> int:
+        return len(self._keys())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "circuit_open": self.circuit_open,
+            "evictions": 0,
+            "expirations": 0,
+            "max_size": None,
+            "shards": 1,
+        }
@@ -1,44 +1,74 @@
-import asyncio
-from typing import Dict, Optional, Tuple, Any
-from datetime import datetime, timedelta
-import threading
+from typing import Any, Callable, Dict, NamedTuple, Optional
+from app.services.cache_backends import (
+    CacheBackend, MemoryCacheBackend, RespCacheBackend, SharedMemoryCacheBackend
+)
+from app.config import settings
+
+class CacheCodec(NamedTuple):
+    encode: Callable[[Any], bytes]
+    decode: Callable[[bytes], Any]
 
 class CacheService:
-    def __init__(self, max_size: int = 1000, ttl_seconds: int = 3600):
-        self.cache: Dict[str, Tuple[Any, datetime]] = {}
+    """TTL cache in front of a pluggable backend.
+
+    The in-memory backend stores values as they are; shared backends (used by
+    every worker process) store them serialized with ``codec``, which they require.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: int = 3600, num_shards: int = 1, sweep_interval_seconds: int = 60,
+                 backend: Optional[CacheBackend] = None, codec: Optional[CacheCodec] = None):
         self.max_size = max_size
         self.ttl_seconds = ttl_seconds
-        self._lock = threading.Lock()
-    
+        self.backend = backend or MemoryCacheBackend(max_size, num_shards, sweep_interval_seconds)
+        if self.backend.binary and codec is None:
+            raise ValueError(f"The {self.backend.name} cache backend stores bytes and needs a codec")
+        self.codec = codec
+
     def get(self, key: str) -> Optional[Any]:
-        with self._lock:
-            if key in self.cache:
-                value, timestamp = self.cache[key]
-                print(f"Cache hit for key: {key}, value: {value}")
-                if datetime.now() - timestamp < timedelta(seconds=self.ttl_seconds):
-                    return value
-                else:
-                    del self.cache[key]
-            print(f"Cache miss for key: {key}")
-            return None
-    
+        value = self.backend.get(key)
+        if value is None or not self.backend.binary:
+            return value
+        return self.codec.decode(value)
+
     def set(self, key: str, value: Any) -> None:
         # return if value is None or empty
         if value is None or value == []:
             return
-        with self._lock:
-            if len(self.cache) >= self.max_size:
-                # Remove oldest entry
-                oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k][1])
-                del self.cache[oldest_key]
-            self.cache[key] = (value, datetime.now())
-            print(f"Cache set for key: {key}, value: {value}")
-
-    
+        if self.backend.binary:
+            value = self.codec.encode(value)
+        self.backend.set(key, value, self.ttl_seconds)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(key)
+
+    def sweep(self) -> None:
+        """Drop every expired entry now rather than waiting for lazy expiry"""
+        self.backend.sweep()
+
     def clear(self) -> None:
-        with self._lock:
-            self.cache.clear()
-    
+        self.backend.clear()
+
     def size(self) -> int:
-        with self._lock:
-            return len(self.cache)
\ No newline at end of file
+        return self.backend.size()
+
+    def stats(self) -> Dict[str, Any]:
+        """Backend counters, for sizing the cache from data"""
+        totals = self.backend.stats()
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_rate"] = totals["hits"] / lookups if lookups else 0.0
+        totals["backend"] = self.backend.name
+        return totals
+
+def create_cache_backend() -> CacheBackend:
+    """Backend for the configured ``cache_backend``"""
+    if settings.cache_backend == "shm":
+        return SharedMemoryCacheBackend(settings.cache_shm_path, settings.max_cache_size, settings.cache_shm_slot_bytes)
+    if settings.cache_backend == "redis":
+        return RespCacheBackend(
+            settings.cache_redis_url,
+            prefix=settings.cache_redis_prefix,
+            timeout_seconds=settings.cache_redis_timeout_seconds,
+            retry_seconds=settings.cache_redis_retry_seconds,
+            max_retry_seconds=settings.cache_redis_max_retry_seconds
+        )
+    return MemoryCacheBackend(settings.max_cache_size, settings.cache_shards, settings.cache_sweep_interval_seconds)
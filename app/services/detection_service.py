@@ -1,96 +1,269 @@
-import cv2
 import numpy as np
 import asyncio
-import face_recognition  # Make sure this import is present
-from typing import Optional, List, Dict, Any
-from app.services.face_service import FaceService
-from app.services.cache_service import CacheService
-from app.database.repositories import FaceEmbeddingRepository, UserRepository
+import functools
+import logging
+from typing import Optional, List, Dict, Any, Set
+from app.services.face_service import FaceService, get_face_service
+from app.services.cache_service import CacheService, create_cache_backend
+from app.services.recent_identities import MATCH_CODEC, RecentIdentityCache
+from app.services.matcher_service import EmbeddingMatcher
+from app.services.face_tracker import FaceTracker, Track
+from app.database.repositories import FaceEmbeddingRepository
 from app.database.connection import async_session
+from app.metrics import FACES_IDENTIFIED, RECENT_IDENTITY_LOOKUPS, stage_timer
 from app.config import settings
-import hashlib
+
+logger = logging.getLogger(__name__)
 
 class DetectionService:
-    def __init__(self):
-        self.face_service = FaceService()
+    def __init__(self, face_service: Optional[FaceService] = None):
+        self.face_service = face_service or get_face_service()
+        # Track ids mean nothing to other workers, so identities per track stay in this process
         self.cache_service = CacheService(
             max_size=settings.max_cache_size,
-            ttl_seconds=settings.cache_ttl_seconds
+            ttl_seconds=settings.cache_ttl_seconds,
+            num_shards=settings.cache_shards,
+            sweep_interval_seconds=settings.cache_sweep_interval_seconds
         )
+        self.recent_identities = self.create_recent_identity_cache()
+        self.matcher = EmbeddingMatcher() if settings.matcher_backend == "memory" else None
+        self.tracker = self.create_tracker()
+        self._frame_index = 0
         self._processing_lock = asyncio.Lock()
-        self.detection_method = "hog"
+        self._tasks: Set[asyncio.Task] = set()  # the loop only holds weak references to running tasks
+    
+    async def load_gallery(self) -> None:
+        """Load the in-memory gallery when the memory matcher backend is configured"""
+        if self.matcher is None:
+            return
+        async with async_session() as session:
+            count = await self.matcher.load(session)
+        logger.info("Loaded %d embeddings into the in-memory matcher", count)
+    
+    def add_to_gallery(self, user_id: str, name: str, phone_number: str, embedding: np.ndarray) -> None:
+        """Apply a newly stored embedding to the in-memory gallery"""
+        if self.matcher is not None and self.matcher.loaded:
+            self.matcher.add(user_id, name, phone_number, embedding)
+    
+    def create_recent_identity_cache(self) -> RecentIdentityCache:
+        shared = None
+        if settings.cache_backend != "memory":
+            # Matches keyed on the embedding are what other workers can reuse
+            shared = CacheService(
+                ttl_seconds=settings.recent_identity_ttl_seconds,
+                backend=create_cache_backend(),
+                codec=MATCH_CODEC
+            )
+        return RecentIdentityCache(
+            max_size=settings.recent_identity_max_size,
+            ttl_seconds=settings.recent_identity_ttl_seconds,
+            tolerance=settings.recent_identity_tolerance,
+            shared=shared,
+            lsh_bits=settings.recent_identity_lsh_bits,
+            bucket_entries=settings.recent_identity_bucket_entries,
+            lsh_probes=settings.recent_identity_lsh_probes
+        )
+    
+    def create_tracker(self) -> FaceTracker:
+        return FaceTracker(
+            iou_threshold=settings.tracker_iou_threshold,
+            max_centroid_distance=settings.tracker_max_centroid_distance,
+            max_missed=settings.tracker_max_missed
+        )
+    
+    async def detect_faces(self, rgb_frame: np.ndarray) -> List[tuple]:
+        """Run the face detector in the face engine's worker pool"""
+        with stage_timer("detect"):
+            return await self.face_service.detect_face_locations(
+                rgb_frame,
+                detector=settings.detection_model,
+                scale=settings.detection_scale,
+                upsample=settings.detection_upsample
+            )
+    
+    def update_tracks(self, tracker: FaceTracker, face_locations: List[tuple], frame_index: int) -> List[Track]:
+        """Feed fresh detections to a tracker; returns the tracks that need identification"""
+        tracks, dropped = tracker.update(face_locations, frame_index)
+        for track in dropped:
+            self.cache_service.delete(self._track_key(track.track_id))
+        
+        # Only freshly detected boxes are worth encoding
+        targets = [t for t in tracks if t.misses == 0 and self._needs_identification(tracker, t, frame_index)]
+        for track in targets:
+            track.pending = True
+        return targets
+    
+    def tracked_matches(self, tracker: FaceTracker) -> List[Dict[str, Any]]:
+        """Identities of the currently visible tracks, positioned at their latest boxes"""
+        matches = []
+        for track in tracker.tracks:
+            identity = self.cache_service.get(self._track_key(track.track_id))
+            if identity and track.misses == 0:
+                matches.append({**identity, 'bbox': track.bbox})
+        return matches
     
     async def process_frame(self, frame: np.ndarray) -> np.ndarray:
         """Process a single frame and return annotated frame"""
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        faces = face_recognition.face_locations(rgb_frame, model=self.detection_method)
-        for (x, y, w, h) in faces:
-            face_img = rgb_frame[y:y+h, x:x+w]
-            face_hash = str(hash(face_img.tobytes()))
-            # Check cache first
-            cached_result = self.cache_service.get(face_hash)
-            if cached_result:
-                return self._annotate_frame(frame, cached_result)
+        import cv2
         
-        # If not in cache, process asynchronously without blocking
-        asyncio.create_task(self._process_and_cache_frame(frame))
+        loop = asyncio.get_running_loop()
+        self._frame_index += 1
+        frame_index = self._frame_index
         
-        # Return original frame
-        return frame
-    
-    async def _process_and_cache_frame(self, frame: np.ndarray) -> None:
-        """Process frame and update cache asynchronously"""
-        async with self._processing_lock:         
-            try:
-                # Detect faces
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                face_locations = face_recognition.face_locations(rgb_frame, model=self.detection_method)
-                # Extract encodings
-                # encodings = await self.face_service.extract_face_encodings(rgb_frame, face_locations)
-                encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-                
-                # Find matches in database
-                matches = []
-                async with async_session() as session:
-                    embedding_repo = FaceEmbeddingRepository(session)
-                    user_repo = UserRepository(session)
-                    
-                    for i, encoding in enumerate(encodings):
-                        (x, y, w, h) = face_locations[i]
-                        face_img = rgb_frame[y:y+h, x:x+w]
-                        face_hash = str(hash(face_img.tobytes()))
-                        similar_faces = await embedding_repo.find_similar_faces(
-                            encoding, 
-                            threshold=settings.face_recognition_tolerance
-                        )
-                        
-                        if similar_faces:
-                            user_id, confidence = similar_faces[0]
-                            print(f"Similar face found: {user_id}, confidence: {confidence}")
-                            user = await user_repo.get_user_by_id(user_id)
-                            if user:
-                                matches.append({
-                                    'bbox': face_locations[i],
-                                    'name': user.name,
-                                    'phone': user.phone_number,
-                                    'confidence': confidence
-                                })
-                        else:
-                            matches.append({
-                                'bbox': face_locations[i],
-                                'name': 'Unknown',
-                                'phone': '',
-                                'confidence': 0.0
-                            })
-                
-                        # Cache the results
-                        self.cache_service.set(face_hash, matches)
+        if (frame_index - 1) % max(1, settings.detection_interval_frames) == 0:
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            face_locations = await self.detect_faces(rgb_frame)
+            targets = self.update_tracks(self.tracker, face_locations, frame_index)
+            
+            # One recognition pass at a time; later detections pick up whatever is skipped
+            if targets and not self._processing_lock.locked():
+                boxes = [track.bbox for track in targets]
+                task = asyncio.create_task(self._process_and_cache_frame(rgb_frame, frame_index, targets, boxes))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            else:
+                self.release_targets(targets)
+        else:
+            # Between detections, propagate boxes instead of running HOG
+            self.tracker.propagate(frame_index)
+        
+        matches = self.tracked_matches(self.tracker)
+        if not matches:
+            return frame
+        with stage_timer("annotate"):
+            return await loop.run_in_executor(None, self.annotate_frame, frame, matches)
+    
+    async def wait_for_recognition(self) -> None:
+        """Wait until the recognition passes started by process_frame have finished"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+    
+    def _needs_identification(self, tracker: FaceTracker, track: Track, frame_index: int) -> bool:
+        """New tracks, periodic re-verification, and tracks whose association or match is weak"""
+        if track.pending:
+            return False
+        if track.verified_frame is None:
+            return True
+        if frame_index - track.verified_frame >= settings.tracker_reverify_frames:
+            return True
+        if track.association_score < tracker.iou_threshold:
+            # Matched by centroid only; the box may have jumped to another person
+            return True
+        identity = self.cache_service.get(self._track_key(track.track_id))
+        if identity is None:
+            return True
+        return identity['name'] != 'Unknown' and identity['confidence'] < settings.tracker_reverify_confidence
+    
+    def _track_key(self, track_id: int) -> str:
+        return f"track:{track_id}"
+    
+    def release_targets(self, targets: List[Track]) -> None:
+        """Give up on identifying ``targets`` for now so a later detection can retry"""
+        for track in targets:
+            track.pending = False
+    
+    async def _process_and_cache_frame(self, rgb_frame: np.ndarray, frame_index: int, targets: List[Track],
+                                       boxes: List[tuple]) -> None:
+        async with self._processing_lock:
+            await self.identify_tracks(rgb_frame, frame_index, targets, boxes)
+    
+    async def identify_tracks(self, rgb_frame: np.ndarray, frame_index: int, targets: List[Track],
+                              boxes: List[tuple]) -> None:
+        """Encode and identify tracked faces, caching the identity per track.
+
+        ``boxes`` are the tracks' boxes as detected in ``rgb_frame``; the tracks
+        themselves may have been propagated to later frames since.
+        """
+        try:
+            # Extract encodings in the face engine's worker pool
+            with stage_timer("encode"):
+                encodings = await self.face_service.extract_qualified_encodings(rgb_frame, boxes)
+            
+            # Low-quality faces stay unidentified; their tracks are retried on the next detection
+            qualified = [(track, encoding) for track, encoding in zip(targets, encodings) if encoding is not None]
+            if not qualified:
+                return
+            targets_to_match = [track for track, _ in qualified]
+            
+            # Find matches in the configured backend
+            best_matches = await self.match_encodings([encoding for _, encoding in qualified])
+            for track, best in zip(targets_to_match, best_matches):
+                FACES_IDENTIFIED.inc("known" if best else "unknown")
+                if best:
+                    logger.debug("Similar face found: %s, confidence: %s", best['user_id'], best['similarity'])
+                    identity = {
+                        'name': best['name'],
+                        'phone': best['phone_number'],
+                        'confidence': best['similarity']
+                    }
+                else:
+                    identity = {
+                        'name': 'Unknown',
+                        'phone': '',
+                        'confidence': 0.0
+                    }
                 
-            except Exception as e:
-                print(f"Error processing frame: {e}")
+                # Cache the identity for the life of the track
+                self.cache_service.set(self._track_key(track.track_id), identity)
+                track.verified_frame = frame_index
+            
+        except Exception as e:
+            logger.exception("Error processing frame: %s", e)
+        finally:
+            self.release_targets(targets)
+    
+    async def match_encodings(self, encodings: List[np.ndarray]) -> List[Optional[Dict[str, Any]]]:
+        """Return the best match (user_id, name, phone_number, similarity) per encoding, or None"""
+        # Faces close to a recent match reuse it; only the rest are searched
+        results = await self._recent_identities_call(self.recent_identities.lookup, encodings)
+        for result in results:
+            RECENT_IDENTITY_LOOKUPS.inc("hit" if result else "miss")
+        misses = [i for i, result in enumerate(results) if result is None]
+        if not misses:
+            return results
+        
+        searched = await self.search_encodings([encodings[i] for i in misses])
+        await self._recent_identities_call(self.recent_identities.remember, [encodings[i] for i in misses], searched)
+        for i, match in zip(misses, searched):
+            results[i] = match
+        return results
+    
+    async def _recent_identities_call(self, method, *args):
+        """Shared cache round trips block, so they run off the event loop; local lookups stay inline"""
+        if self.recent_identities.shared is None:
+            return method(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
     
-    def _annotate_frame(self, frame: np.ndarray, matches: List[Dict[str, Any]]) -> np.ndarray:
+    async def search_encodings(self, encodings: List[np.ndarray]) -> List[Optional[Dict[str, Any]]]:
+        """Best match per encoding from the configured matcher backend"""
+        if self.matcher is not None:
+            with stage_timer("vector_search"):
+                results = await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    functools.partial(
+                        self.matcher.match,
+                        encodings,
+                        threshold=settings.face_recognition_tolerance,
+                        limit=settings.matcher_top_k
+                    )
+                )
+            return [candidates[0] if candidates else None for candidates in results]
+        
+        async with async_session() as session:
+            embedding_repo = FaceEmbeddingRepository(session)
+            # The batch query joins users, so this also covers the user lookup
+            with stage_timer("vector_search"):
+                results = await embedding_repo.find_similar_faces_batch(
+                    encodings,
+                    threshold=settings.face_recognition_tolerance,
+                    limit=settings.matcher_top_k
+                )
+        return [candidates[0] if candidates else None for candidates in results]
+    
+    def annotate_frame(self, frame: np.ndarray, matches: List[Dict[str, Any]]) -> np.ndarray:
         """Annotate frame with face detection results"""
+        import cv2
+        
         annotated_frame = frame.copy()
         
         for match in matches:
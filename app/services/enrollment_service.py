@@ -0,0 +1,213 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import uuid
+import zipfile
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.services.face_service import FaceService
+from app.database.repositories import EnrollmentRepository
+from app.database.connection import async_session
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAMES = ("manifest.csv", "manifest.json")
+
+def parse_manifest(content: bytes, filename: str) -> List[Dict[str, Any]]:
+    """Parse a manifest into ``{name, phone_number, images}`` entries.
+
+    CSV manifests have ``name``, ``phone_number`` and ``images`` columns, with
+    several images separated by ``;``. JSON manifests are a list of objects
+    with the same keys, where ``images`` may be a string or a list.
+    """
+    if filename.lower().endswith(".json"):
+        rows = json.loads(content)
+    else:
+        rows = list(csv.DictReader(io.StringIO(content.decode("utf-8-sig"))))
+
+    entries = []
+    for row in rows:
+        images = row.get("images") or row.get("image") or []
+        if isinstance(images, str):
+            images = images.split(";")
+        entries.append({
+            "name": (row.get("name") or "").strip(),
+            "phone_number": (row.get("phone_number") or "").strip(),
+            "images": [path.strip() for path in images if path and path.strip()]
+        })
+    return entries
+
+class ArchiveTooLargeError(ValueError):
+    """An uploaded archive exceeds one of the bulk enrollment limits"""
+
+class ZipImageSource:
+    """Manifest and images packed in one zip; image paths are relative to the manifest.
+
+    ``max_entries`` and ``max_uncompressed_bytes`` are checked against the
+    central directory before anything is extracted. zipfile never inflates a
+    member past its declared size, so a zip bomb is refused up front.
+    """
+
+    def __init__(self, archive: zipfile.ZipFile, max_entries: Optional[int] = None,
+                 max_uncompressed_bytes: Optional[int] = None):
+        self.archive = archive
+        members = archive.infolist()
+        if max_entries is not None and len(members) > max_entries:
+            raise ArchiveTooLargeError(f"Archive has {len(members)} entries, the limit is {max_entries}")
+        uncompressed = sum(member.file_size for member in members)
+        if max_uncompressed_bytes is not None and uncompressed > max_uncompressed_bytes:
+            raise ArchiveTooLargeError(
+                f"Archive expands to {uncompressed} bytes, the limit is {max_uncompressed_bytes}"
+            )
+        candidates = [
+            name for name in archive.namelist()
+            if os.path.basename(name).lower() in MANIFEST_NAMES
+        ]
+        if not candidates:
+            raise ValueError(f"Archive contains none of {', '.join(MANIFEST_NAMES)}")
+        self.manifest_name = min(candidates, key=len)
+        self._base = os.path.dirname(self.manifest_name)
+
+    def manifest(self) -> Tuple[bytes, str]:
+        return self.archive.read(self.manifest_name), self.manifest_name
+
+    def read(self, path: str) -> bytes:
+        return self.archive.read(os.path.normpath(os.path.join(self._base, path)).replace(os.sep, "/"))
+
+class DirectoryImageSource:
+    """Manifest file on disk; image paths are relative to its directory"""
+
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self._base = os.path.dirname(os.path.abspath(manifest_path))
+
+    def manifest(self) -> Tuple[bytes, str]:
+        with open(self.manifest_path, "rb") as f:
+            return f.read(), self.manifest_path
+
+    def read(self, path: str) -> bytes:
+        with open(os.path.join(self._base, path), "rb") as f:
+            return f.read()
+
+def open_image_source(path: str):
+    """Pick the image source for a CLI argument: a zip archive or a manifest file"""
+    if zipfile.is_zipfile(path):
+        return ZipImageSource(zipfile.ZipFile(path))
+    return DirectoryImageSource(path)
+
+class EnrollmentService:
+    """Enrolls many users per call: batched parallel encoding, bulk writes, per-item results.
+
+    A failing image, user or database chunk is reported in the results instead
+    of aborting the rest of the batch.
+    """
+
+    def __init__(self, face_service: FaceService,
+                 on_enrolled: Optional[Callable[[Dict[str, Any], np.ndarray], None]] = None):
+        self.face_service = face_service
+        self.on_enrolled = on_enrolled
+
+    async def enroll_source(self, source, batch_size: Optional[int] = None) -> Dict[str, Any]:
+        def _load_manifest() -> List[Dict[str, Any]]:
+            content, filename = source.manifest()
+            return parse_manifest(content, filename)
+
+        entries = await asyncio.get_running_loop().run_in_executor(None, _load_manifest)
+        return await self.enroll(entries, source, batch_size)
+
+    async def enroll(self, entries: List[Dict[str, Any]], source, batch_size: Optional[int] = None) -> Dict[str, Any]:
+        batch_size = batch_size or settings.enrollment_batch_size
+        results = [
+            {"index": i, "name": entry["name"] or None, "status": "failed", "user_id": None, "embeddings": 0, "errors": []}
+            for i, entry in enumerate(entries)
+        ]
+
+        chunks = [list(range(start, min(start + batch_size, len(entries)))) for start in range(0, len(entries), batch_size)]
+        # Encode the next chunk while the current one is being written
+        prepared = await self._prepare(entries, chunks[0], source, results) if chunks else None
+        for position in range(len(chunks)):
+            next_task = None
+            if position + 1 < len(chunks):
+                next_task = asyncio.create_task(self._prepare(entries, chunks[position + 1], source, results))
+            await self._write(entries, prepared, results)
+            if next_task is not None:
+                prepared = await next_task
+
+        enrolled = sum(1 for result in results if result["status"] == "enrolled")
+        return {"total": len(results), "enrolled": enrolled, "failed": len(results) - enrolled, "results": results}
+
+    async def _prepare(self, entries: List[Dict[str, Any]], indices: List[int], source,
+                       results: List[Dict[str, Any]]) -> Dict[int, List[Tuple[np.ndarray, Dict[str, Any]]]]:
+        """Read and encode every image of a chunk; returns the usable encodings per entry"""
+        jobs = []
+        for i in indices:
+            entry = entries[i]
+            if not entry["name"] or not entry["phone_number"]:
+                results[i]["errors"].append("name and phone_number are required")
+                continue
+            if not entry["images"]:
+                results[i]["errors"].append("no images listed")
+                continue
+            jobs.extend((i, path) for path in entry["images"])
+
+        def _read_all() -> List[Tuple[int, str, Optional[bytes], Optional[str]]]:
+            read = []
+            for i, path in jobs:
+                try:
+                    read.append((i, path, source.read(path), None))
+                except Exception as e:
+                    read.append((i, path, None, str(e)))
+            return read
+
+        read = await asyncio.get_running_loop().run_in_executor(None, _read_all)
+        readable = [job for job in read if job[2] is not None]
+        encoded = await self.face_service.process_uploaded_images([job[2] for job in readable])
+
+        prepared: Dict[int, List[Tuple[np.ndarray, Dict[str, Any]]]] = {}
+        for i, path, _, error in read:
+            if error is not None:
+                results[i]["errors"].append(f"{path}: {error}")
+        for (i, path, _, _), (encoding, face_info, error) in zip(readable, encoded):
+            if encoding is None:
+                results[i]["errors"].append(f"{path}: {error}")
+                continue
+            prepared.setdefault(i, []).append((encoding, {"face_info": face_info, "source": path}))
+
+        for i in indices:
+            if i not in prepared and not results[i]["errors"]:
+                results[i]["errors"].append("no usable face found")
+        return prepared
+
+    async def _write(self, entries: List[Dict[str, Any]], prepared: Dict[int, List[Tuple[np.ndarray, Dict[str, Any]]]],
+                     results: List[Dict[str, Any]]) -> None:
+        """Write one chunk in a single transaction; a failure marks the whole chunk failed"""
+        if not prepared:
+            return
+
+        users, embeddings = [], []
+        for i, faces in prepared.items():
+            user = {"user_id": str(uuid.uuid4()), "name": entries[i]["name"], "phone_number": entries[i]["phone_number"]}
+            users.append(user)
+            embeddings.extend(
+                {"user_id": user["user_id"], "embedding": encoding, "face_metadata": face_metadata}
+                for encoding, face_metadata in faces
+            )
+
+        try:
+            async with async_session() as session:
+                await EnrollmentRepository(session).bulk_create(users, embeddings)
+        except Exception as e:
+            logger.exception("Bulk enrollment write error: %s", e)
+            for i in prepared:
+                results[i]["errors"].append(f"database: {e}")
+            return
+
+        for (i, faces), user in zip(prepared.items(), users):
+            results[i].update(status="enrolled", user_id=user["user_id"], embeddings=len(faces))
+            if self.on_enrolled is not None:
+                for encoding, _ in faces:
+                    self.on_enrolled(user, encoding)
@@ -0,0 +1,383 @@
+import asyncio
+import os
+import threading
+import numpy as np
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+from app.config import settings
+from app.services.face_quality import QualityThresholds, assess_faces
+
+class FrameHandle(NamedTuple):
+    """Picklable reference to a frame living in a shared-memory slot"""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+FrameRef = Union[FrameHandle, np.ndarray]
+
+# ---------------------------------------------------------------------------
+# Worker side: everything below runs inside the pool processes
+# ---------------------------------------------------------------------------
+
+_attached: Dict[str, SharedMemory] = {}
+
+def _init_worker() -> None:
+    """Import face_recognition once per worker so dlib's models are loaded up front"""
+    import face_recognition  # noqa: F401
+
+def warm_up_worker(detector: str = "hog", encoding_model: str = "small") -> str:
+    """Run one detection and one encoding on a blank frame so dlib's first-call costs are paid now"""
+    import face_recognition
+
+    frame = np.zeros((150, 150, 3), dtype=np.uint8)
+    _detect(frame, detector, 1.0, 0)
+    face_recognition.face_encodings(frame, [(0, 150, 150, 0)], model=encoding_model)
+    return f"{os.getpid()}/{threading.get_ident()}"
+
+def _attach(name: str) -> SharedMemory:
+    segment = _attached.get(name)
+    if segment is None:
+        # Pool workers share the parent's resource tracker, so attaching does not
+        # transfer ownership; the parent unlinks the segments on shutdown
+        segment = SharedMemory(name=name)
+        _attached[name] = segment
+    return segment
+
+def resolve_frame(ref: FrameRef) -> np.ndarray:
+    """Turn a FrameHandle into a zero-copy view of its slot; arrays pass through"""
+    if isinstance(ref, FrameHandle):
+        segment = _attach(ref.name)
+        return np.ndarray(ref.shape, dtype=np.dtype(ref.dtype), buffer=segment.buf)
+    return ref
+
+_cascade = None
+
+def _haar_cascade():
+    """Load the Haar cascade once per worker instead of on every call"""
+    global _cascade
+    if _cascade is None:
+        import cv2
+        _cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return _cascade
+
+def _detect(image: np.ndarray, detector: str, scale: float, upsample: int) -> List[tuple]:
+    """Detect on a downscaled copy and map the boxes back to full-resolution coordinates"""
+    import cv2
+    import face_recognition
+
+    small = image
+    if scale != 1.0:
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    if detector == "haar":
+        gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+        faces = _haar_cascade().detectMultiScale(gray, 1.1, 4)
+        # Same (top, right, bottom, left) order as face_recognition
+        locations = [(y, x + w, y + h, x) for (x, y, w, h) in faces]
+    else:
+        locations = face_recognition.face_locations(small, number_of_times_to_upsample=upsample, model=detector)
+
+    if scale == 1.0:
+        return [tuple(int(v) for v in location) for location in locations]
+
+    height, width = image.shape[:2]
+    return [
+        (
+            max(0, int(round(top / scale))),
+            min(width, int(round(right / scale))),
+            min(height, int(round(bottom / scale))),
+            max(0, int(round(left / scale)))
+        )
+        for (top, right, bottom, left) in locations
+    ]
+
+def detect_locations(ref: FrameRef, detector: str = "hog", scale: float = 1.0, upsample: int = 1) -> List[tuple]:
+    """(top, right, bottom, left) boxes in full-resolution coordinates"""
+    return _detect(resolve_frame(ref), detector, scale, upsample)
+
+def encode_locations(ref: FrameRef, face_locations: List[tuple], model: str = "small") -> List[np.ndarray]:
+    """Landmarks and encodings always come from the full-resolution frame"""
+    import face_recognition
+    return face_recognition.face_encodings(resolve_frame(ref), face_locations, model=model)
+
+def encode_qualified_locations(ref: FrameRef, face_locations: List[tuple], model: str = "small",
+                               quality: Optional[QualityThresholds] = None) -> List[Tuple[Optional[np.ndarray], Optional[str]]]:
+    """``(encoding, None)`` per face that passes the quality gate, ``(None, reason)`` for the rest"""
+    import face_recognition
+
+    image = resolve_frame(ref)
+    reasons = assess_faces(image, face_locations, quality) if quality else [None] * len(face_locations)
+    passed = [location for location, reason in zip(face_locations, reasons) if reason is None]
+    encodings = iter(face_recognition.face_encodings(image, passed, model=model) if passed else [])
+    return [(next(encodings), None) if reason is None else (None, reason) for reason in reasons]
+
+def detect_haar(ref: FrameRef, scale_factor: float = 1.1, min_neighbors: int = 4) -> List[tuple]:
+    import cv2
+    gray = cv2.cvtColor(resolve_frame(ref), cv2.COLOR_RGB2GRAY)
+    return [tuple(int(v) for v in face) for face in _haar_cascade().detectMultiScale(gray, scale_factor, min_neighbors)]
+
+def process_image_bytes(image_bytes: bytes, detector: str = "hog", scale: float = 1.0, upsample: int = 1,
+                        encoding_model: str = "small") -> Tuple[Optional[np.ndarray], List[dict]]:
+    """Decode an uploaded image and return the first face's encoding and location info"""
+    import cv2
+    import face_recognition
+
+    # Convert bytes to numpy array
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if image is None:
+        return None, []
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    # Detect faces (optionally on a downscaled copy)
+    face_locations = _detect(image_rgb, detector, scale, upsample)
+    if not face_locations:
+        return None, []
+
+    # Get encodings
+    encodings = face_recognition.face_encodings(image_rgb, face_locations, model=encoding_model)
+    if not encodings:
+        return None, []
+
+    # Return first face encoding and location info
+    return encodings[0], [{'bbox': face_locations[0]}]
+
+def process_image_batch(images: List[bytes], detector: str = "hog", scale: float = 1.0, upsample: int = 1,
+                        encoding_model: str = "small") -> List[Tuple[Optional[np.ndarray], List[dict], Optional[str]]]:
+    """Run process_image_bytes over many images in one worker call; errors are reported per image"""
+    results = []
+    for image_bytes in images:
+        try:
+            encoding, face_info = process_image_bytes(image_bytes, detector, scale, upsample, encoding_model)
+            results.append((encoding, face_info, None if encoding is not None else "No face detected in the image"))
+        except Exception as e:
+            results.append((None, [], str(e)))
+    return results
+
+def analyze_image_bytes(image_bytes: bytes, cropped: bool = False, detector: str = "hog", scale: float = 1.0,
+                        upsample: int = 1, encoding_model: str = "small",
+                        quality: Optional[QualityThresholds] = None) -> List[Tuple[tuple, Optional[np.ndarray], Optional[str]]]:
+    """Decode a client frame and return ``(bbox, encoding, skip_reason)`` for every face in it.
+
+    With ``cropped`` the image is taken to be a single pre-cropped face and
+    detection is skipped. Faces failing the ``quality`` gate come back with
+    no encoding and the reason they were skipped.
+    """
+    import cv2
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image")
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    if cropped:
+        height, width = image_rgb.shape[:2]
+        return _encode_faces(image_rgb, [(0, width, height, 0)], encoding_model, quality)
+    return analyze_frame(image_rgb, detector, scale, upsample, encoding_model, quality)
+
+def _encode_faces(image_rgb: np.ndarray, face_locations: List[tuple], encoding_model: str,
+                  quality: Optional[QualityThresholds]) -> List[Tuple[tuple, Optional[np.ndarray], Optional[str]]]:
+    if not face_locations:
+        return []
+    encoded = encode_qualified_locations(image_rgb, face_locations, encoding_model, quality)
+    return [(location, encoding, reason) for location, (encoding, reason) in zip(face_locations, encoded)]
+
+def analyze_frame(image_rgb: np.ndarray, detector: str = "hog", scale: float = 1.0, upsample: int = 1,
+                  encoding_model: str = "small",
+                  quality: Optional[QualityThresholds] = None) -> List[Tuple[tuple, Optional[np.ndarray], Optional[str]]]:
+    """Detect and encode every face of a decoded RGB frame; ``(bbox, encoding, skip_reason)`` per face"""
+    return _encode_faces(image_rgb, _detect(image_rgb, detector, scale, upsample), encoding_model, quality)
+
+def analyze_image_batch(items: List[Tuple[bytes, bool]], detector: str = "hog", scale: float = 1.0, upsample: int = 1,
+                        encoding_model: str = "small", quality: Optional[QualityThresholds] = None
+                        ) -> List[Tuple[List[Tuple[tuple, Optional[np.ndarray], Optional[str]]], Optional[str]]]:
+    """Run analyze_image_bytes over many client frames in one worker call; errors are reported per frame"""
+    results = []
+    for image_bytes, cropped in items:
+        try:
+            faces = analyze_image_bytes(image_bytes, cropped, detector, scale, upsample, encoding_model, quality)
+            results.append((faces, None))
+        except Exception as e:
+            results.append(([], str(e)))
+    return results
+
+def analyze_image_files(paths: List[str], detector: str = "hog", scale: float = 1.0, upsample: int = 1,
+                        encoding_model: str = "small", quality: Optional[QualityThresholds] = None
+                        ) -> List[Tuple[List[Tuple[tuple, Optional[np.ndarray], Optional[str]]], Optional[str]]]:
+    """Read and analyze image files in the worker, so only the results cross the process boundary"""
+    results = []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                image_bytes = f.read()
+            faces = analyze_image_bytes(image_bytes, False, detector, scale, upsample, encoding_model, quality)
+            results.append((faces, None))
+        except Exception as e:
+            results.append(([], str(e)))
+    return results
+
+def analyze_video_segment(path: str, start: int, stop: Optional[int], step: int = 1, detector: str = "hog",
+                          scale: float = 1.0, upsample: int = 1, encoding_model: str = "small",
+                          quality: Optional[QualityThresholds] = None
+                          ) -> List[Tuple[int, float, List[Tuple[tuple, Optional[np.ndarray], Optional[str]]]]]:
+    """Decode frames ``[start, stop)`` of a video and analyze every ``step``-th one.
+
+    Returns ``(frame_index, timestamp_seconds, faces)`` per sampled frame.
+    Frames in between are grabbed without being converted.
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video {path}")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+        if start:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+        results = []
+        index = start
+        while stop is None or index < stop:
+            if index % step:
+                if not capture.grab():
+                    break
+            else:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                faces = analyze_frame(image_rgb, detector, scale, upsample, encoding_model, quality)
+                results.append((index, index / fps if fps else 0.0, faces))
+            index += 1
+        return results
+    finally:
+        capture.release()
+
+# ---------------------------------------------------------------------------
+# Parent side
+# ---------------------------------------------------------------------------
+
+class SharedFrameRing:
+    """Fixed set of shared-memory slots that frames are copied into instead of being pickled"""
+
+    def __init__(self, slots: int, slot_bytes: int):
+        self.slot_bytes = slot_bytes
+        self._segments = [SharedMemory(create=True, size=slot_bytes) for _ in range(slots)]
+        self._free: Optional[asyncio.Queue] = None
+
+    def _free_slots(self) -> asyncio.Queue:
+        if self._free is None:
+            self._free = asyncio.Queue()
+            for index in range(len(self._segments)):
+                self._free.put_nowait(index)
+        return self._free
+
+    async def acquire(self) -> int:
+        """Wait for a free slot; this is what bounds the number of frames in flight"""
+        return await self._free_slots().get()
+
+    def release(self, slot: int) -> None:
+        self._free_slots().put_nowait(slot)
+
+    def write(self, slot: int, frame: np.ndarray) -> FrameHandle:
+        segment = self._segments[slot]
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=segment.buf)
+        view[...] = frame
+        return FrameHandle(segment.name, frame.shape, frame.dtype.str)
+
+    def close(self) -> None:
+        for segment in self._segments:
+            segment.close()
+            segment.unlink()
+        self._segments = []
+
+class FaceEngine:
+    """Pool of face_recognition workers, each loading the dlib models once.
+
+    In process mode frames are handed over through a ``SharedFrameRing``;
+    frames larger than a slot fall back to being pickled.
+    """
+
+    def __init__(self, workers: int = 0, use_processes: bool = True, ring_slots: int = 8, slot_bytes: int = 1920 * 1080 * 3):
+        self.workers = workers or os.cpu_count() or 1
+        self.use_processes = use_processes
+        self.pending = 0
+        self._ring: Optional[SharedFrameRing] = None
+        if use_processes:
+            # spawn: forking a process that already runs threads (and dlib) is not safe
+            self.executor: Executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker
+            )
+            self._ring = SharedFrameRing(ring_slots, slot_bytes)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run a picklable function in the pool"""
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def run_on_frame(self, fn: Callable[..., Any], frame: np.ndarray, *args: Any) -> Any:
+        """Run ``fn(frame_ref, *args)`` in the pool, passing the frame through shared memory"""
+        if self._ring is None or frame.nbytes > self._ring.slot_bytes:
+            return await self.run(fn, frame, *args)
+
+        ring = self._ring
+        slot = await ring.acquire()
+        try:
+            handle = ring.write(slot, np.ascontiguousarray(frame))
+            future = asyncio.get_running_loop().run_in_executor(self.executor, fn, handle, *args)
+        except BaseException:
+            ring.release(slot)
+            raise
+        # The slot is only reusable once the worker is done reading it, even if our caller is cancelled
+        future.add_done_callback(lambda _: ring.release(slot))
+
+        self.pending += 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self.pending -= 1
+
+    async def warm_up(self, detector: str = "hog", encoding_model: str = "small") -> int:
+        """Run warm_up_worker once per worker slot; returns how many distinct workers ran it"""
+        # Submitted together, the jobs make the pool start all of its workers
+        workers = await asyncio.gather(*(self.run(warm_up_worker, detector, encoding_model) for _ in range(self.workers)))
+        return len(set(workers))
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+_engine: Optional[FaceEngine] = None
+
+def get_face_engine() -> FaceEngine:
+    """Process-wide engine, created on first use"""
+    global _engine
+    if _engine is None:
+        _engine = FaceEngine(
+            workers=settings.face_engine_workers,
+            use_processes=settings.face_engine_processes,
+            ring_slots=settings.face_engine_ring_slots,
+            slot_bytes=settings.face_engine_slot_bytes
+        )
+    return _engine
+
+def face_engine_pending() -> int:
+    """Jobs queued or running in the engine, without starting one"""
+    return _engine.pending if _engine is not None else 0
+
+def shutdown_face_engine() -> None:
+    global _engine
+    if _engine is not None:
+        _engine.shutdown()
+        _engine = None
@@ -0,0 +1,83 @@
+"""Cheap pre-encoding checks that spare the landmark + ResNet pass for faces that would not match anyway.
+
+Checks run cheapest first (box size, brightness, sharpness, then pose from the
+5-point landmark model) and stop at the first failure. Everything here runs in
+the face engine workers.
+"""
+import math
+import numpy as np
+from typing import List, NamedTuple, Optional, Tuple
+from app.config import settings
+
+SHARPNESS_CROP = 64  # crops are resized to this before the Laplacian, so the score ignores face size
+
+class QualityThresholds(NamedTuple):
+    min_face_size: int
+    min_sharpness: float
+    min_brightness: float
+    max_brightness: float
+    max_yaw: float
+    max_roll_degrees: float
+
+def thresholds_from_settings() -> Optional[QualityThresholds]:
+    """The configured thresholds, or None when the quality gate is off"""
+    if not settings.quality_gate_enabled:
+        return None
+    return QualityThresholds(
+        settings.quality_min_face_size,
+        settings.quality_min_sharpness,
+        settings.quality_min_brightness,
+        settings.quality_max_brightness,
+        settings.quality_max_yaw,
+        settings.quality_max_roll_degrees
+    )
+
+def _pose(landmarks: dict) -> Tuple[float, float]:
+    """(yaw, roll): nose offset from the eye midpoint relative to the eye distance, and eye-line angle in degrees"""
+    left = np.mean(landmarks['left_eye'], axis=0)
+    right = np.mean(landmarks['right_eye'], axis=0)
+    nose = np.asarray(landmarks['nose_tip'][0], dtype=np.float64)
+    dx, dy = right - left
+    eye_distance = max(1.0, math.hypot(dx, dy))
+    # Project the nose onto the eye line; a frontal face has it at the midpoint
+    offset = np.dot(nose - (left + right) / 2.0, (dx, dy)) / eye_distance
+    roll = math.degrees(math.atan2(dy, dx))
+    if roll > 90:
+        roll -= 180
+    elif roll < -90:
+        roll += 180
+    return abs(offset) / eye_distance, abs(roll)
+
+def assess_faces(image: np.ndarray, face_locations: List[tuple], thresholds: QualityThresholds) -> List[Optional[str]]:
+    """Rejection reason per face ("size", "brightness", "blur" or "pose"), None for faces worth encoding"""
+    import cv2
+    import face_recognition
+
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+    height, width = gray.shape[:2]
+    reasons: List[Optional[str]] = []
+    for top, right, bottom, left in face_locations:
+        top, bottom = max(0, top), min(height, bottom)
+        left, right = max(0, left), min(width, right)
+        if min(bottom - top, right - left) < thresholds.min_face_size:
+            reasons.append("size")
+            continue
+        crop = gray[top:bottom, left:right]
+        brightness = float(crop.mean())
+        if not thresholds.min_brightness <= brightness <= thresholds.max_brightness:
+            reasons.append("brightness")
+            continue
+        crop = cv2.resize(crop, (SHARPNESS_CROP, SHARPNESS_CROP), interpolation=cv2.INTER_AREA)
+        if cv2.Laplacian(crop, cv2.CV_64F).var() < thresholds.min_sharpness:
+            reasons.append("blur")
+            continue
+        reasons.append(None)
+
+    pending = [i for i, reason in enumerate(reasons) if reason is None]
+    if pending:
+        all_landmarks = face_recognition.face_landmarks(image, [face_locations[i] for i in pending], model="small")
+        for i, landmarks in zip(pending, all_landmarks):
+            yaw, roll = _pose(landmarks)
+            if yaw > thresholds.max_yaw or roll > thresholds.max_roll_degrees:
+                reasons[i] = "pose"
+    return reasons
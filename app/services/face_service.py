@@ -1,84 +1,180 @@
-import face_recognition
 import numpy as np
-import cv2
-from typing import List, Tuple, Optional
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Optional
+from app.services import face_engine
+from app.services.face_engine import FaceEngine, get_face_engine
+from app.services.face_quality import thresholds_from_settings
+from app.metrics import FACES_SKIPPED
+from app.config import settings
 
 class FaceService:
-    def __init__(self):
-        self.executor = ThreadPoolExecutor(max_workers=4)
-    
+    def __init__(self, engine: Optional[FaceEngine] = None):
+        self._engine = engine
+
+    @property
+    def engine(self) -> FaceEngine:
+        # All dlib/OpenCV work goes through the shared worker pool, started on first use
+        return self._engine or get_face_engine()
+
+    async def warm_up(self) -> int:
+        """Start the engine workers and run one inference in each, so the first request is not cold"""
+        return await self.engine.warm_up(settings.detection_model, settings.encoding_model)
+
     async def detect_faces_opencv(self, image: np.ndarray) -> List[dict]:
         """Detect faces using OpenCV's built-in cascade classifier"""
-        def _detect():
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-            
-            return [
-                {
-                    'bbox': [int(x), int(y), int(x + w), int(y + h)],
-                    'confidence': 1.0  # OpenCV doesn't provide confidence scores
-                }
-                for (x, y, w, h) in faces
-            ]
-        
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(self.executor, _detect)
-    
+        faces = await self.engine.run_on_frame(face_engine.detect_haar, image)
+        return [
+            {
+                'bbox': [x, y, x + w, y + h],
+                'confidence': 1.0  # OpenCV doesn't provide confidence scores
+            }
+            for (x, y, w, h) in faces
+        ]
+
     async def detect_faces_face_recognition(self, image: np.ndarray) -> List[dict]:
         """Detect faces using face_recognition library"""
-        def _detect():
-            face_locations = face_recognition.face_locations(image, model="hog")  # Use HOG model for speed
-            
-            return [
-                {
-                    'bbox': [left, top, right, bottom],
-                    'confidence': 1.0
-                }
-                for (top, right, bottom, left) in face_locations
-            ]
-        
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(self.executor, _detect)
-    
+        face_locations = await self.detect_face_locations(
+            image,
+            detector=settings.detection_model,
+            scale=settings.detection_scale,
+            upsample=settings.detection_upsample
+        )
+        return [
+            {
+                'bbox': [left, top, right, bottom],
+                'confidence': 1.0
+            }
+            for (top, right, bottom, left) in face_locations
+        ]
+
+    async def detect_face_locations(self, image: np.ndarray, detector: str = "hog", scale: float = 1.0, upsample: int = 1) -> List[tuple]:
+        """Raw face_recognition locations, (top, right, bottom, left), at full resolution.
+
+        ``detector`` is "haar", "hog" or "cnn"; detection runs on a copy resized by ``scale``.
+        """
+        return await self.engine.run_on_frame(face_engine.detect_locations, image, detector, scale, upsample)
+
     async def extract_face_encodings(self, image: np.ndarray, face_locations: List[tuple]) -> List[np.ndarray]:
         """Extract face encodings using face_recognition"""
-        def _extract():
-            return face_recognition.face_encodings(image, face_locations, model="small")  # Use small model for speed
-        
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(self.executor, _extract)
-    
+        if not face_locations:
+            return []
+        return await self.engine.run_on_frame(face_engine.encode_locations, image, face_locations, settings.encoding_model)
+
+    async def extract_qualified_encodings(self, image: np.ndarray, face_locations: List[tuple]) -> List[Optional[np.ndarray]]:
+        """Like extract_face_encodings, but faces failing the quality gate are not encoded and come back as None"""
+        if not face_locations:
+            return []
+        results = await self.engine.run_on_frame(
+            face_engine.encode_qualified_locations, image, face_locations, settings.encoding_model, thresholds_from_settings()
+        )
+        for _, reason in results:
+            if reason is not None:
+                FACES_SKIPPED.inc(reason)
+        return [encoding for encoding, _ in results]
+
     async def process_uploaded_image(self, image_bytes: bytes) -> Tuple[Optional[np.ndarray], List[dict]]:
         """Process uploaded image and return encoding and face info"""
-        def _process():
-            # Convert bytes to numpy array
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            # Detect faces using face_recognition
-            face_locations = face_recognition.face_locations(image_rgb, model="hog")
-            if not face_locations:
-                return None, []
-            
-            # Get encodings
-            encodings = face_recognition.face_encodings(image_rgb, face_locations, model="small")
-            if not encodings:
-                return None, []
-            
-            # Return first face encoding and location info
-            return encodings[0], [{'bbox': face_locations[0]}]
-        
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(self.executor, _process)
-    
+        # The compressed bytes are far smaller than the decoded frame, so decode in the worker
+        return await self.engine.run(
+            face_engine.process_image_bytes,
+            image_bytes,
+            settings.upload_detection_model,
+            settings.upload_detection_scale,
+            settings.upload_detection_upsample,
+            settings.encoding_model
+        )
+
+    async def process_uploaded_images(self, images: List[bytes]) -> List[Tuple[Optional[np.ndarray], List[dict], Optional[str]]]:
+        """Process many uploaded images in parallel; returns (encoding, face info, error) per image, in order"""
+        if not images:
+            return []
+        # A few sub-batches per worker keeps every core busy without one IPC round trip per image
+        batch_size = max(1, -(-len(images) // (self.engine.workers * 4)))
+        batches = await asyncio.gather(*[
+            self.engine.run(
+                face_engine.process_image_batch,
+                images[start:start + batch_size],
+                settings.upload_detection_model,
+                settings.upload_detection_scale,
+                settings.upload_detection_upsample,
+                settings.encoding_model
+            )
+            for start in range(0, len(images), batch_size)
+        ])
+        return [result for batch in batches for result in batch]
+
+    async def analyze_images(self, items: List[Tuple[bytes, bool]]) -> List[Tuple[List[Tuple[tuple, Optional[np.ndarray], Optional[str]]], Optional[str]]]:
+        """Detect and encode every face of many client frames (``(bytes, cropped)``); returns (faces, error) per frame.
+
+        Each face is ``(bbox, encoding, skip_reason)``; faces failing the quality gate have no encoding.
+        """
+        if not items:
+            return []
+        # One sub-batch per worker: these are live frames, so latency matters more than balance
+        batch_size = max(1, -(-len(items) // self.engine.workers))
+        quality = thresholds_from_settings()
+        batches = await asyncio.gather(*[
+            self.engine.run(
+                face_engine.analyze_image_batch,
+                items[start:start + batch_size],
+                settings.detection_model,
+                settings.detection_scale,
+                settings.detection_upsample,
+                settings.encoding_model,
+                quality
+            )
+            for start in range(0, len(items), batch_size)
+        ])
+        results = [result for batch in batches for result in batch]
+        for faces, _ in results:
+            for _, _, reason in faces:
+                if reason is not None:
+                    FACES_SKIPPED.inc(reason)
+        return results
+
+    async def analyze_image_files(self, paths: List[str]) -> List[Tuple[List[Tuple[tuple, Optional[np.ndarray], Optional[str]]], Optional[str]]]:
+        """Offline counterpart of analyze_images: the worker reads the files itself; (faces, error) per path"""
+        return await self.engine.run(
+            face_engine.analyze_image_files,
+            paths,
+            settings.batch_detection_model,
+            settings.batch_detection_scale,
+            settings.batch_detection_upsample,
+            settings.encoding_model,
+            thresholds_from_settings()
+        )
+
+    async def analyze_video_segment(self, path: str, start: int, stop: Optional[int], step: int
+                                    ) -> List[Tuple[int, float, List[Tuple[tuple, Optional[np.ndarray], Optional[str]]]]]:
+        """Decode and analyze every ``step``-th frame of ``[start, stop)`` in one worker"""
+        return await self.engine.run(
+            face_engine.analyze_video_segment,
+            path,
+            start,
+            stop,
+            step,
+            settings.batch_detection_model,
+            settings.batch_detection_scale,
+            settings.batch_detection_upsample,
+            settings.encoding_model,
+            thresholds_from_settings()
+        )
+
     def compare_faces(self, known_encoding: np.ndarray, face_encoding: np.ndarray, tolerance: float = 0.6) -> bool:
         """Compare two face encodings"""
+        import face_recognition
         return face_recognition.compare_faces([known_encoding], face_encoding, tolerance=tolerance)[0]
-    
+
     def face_distance(self, known_encoding: np.ndarray, face_encoding: np.ndarray) -> float:
         """Calculate distance between face encodings"""
-        return face_recognition.face_distance([known_encoding], face_encoding)[0]
\ No newline at end of file
+        import face_recognition
+        return face_recognition.face_distance([known_encoding], face_encoding)[0]
+
+_face_service: Optional[FaceService] = None
+
+def get_face_service() -> FaceService:
+    """The one FaceService of this process"""
+    global _face_service
+    if _face_service is None:
+        _face_service = FaceService()
+    return _face_service
@@ -0,0 +1,127 @@
+import itertools
+import numpy as np
+from typing import List, Optional, Tuple
+
+BBox = Tuple[int, int, int, int]  # face_recognition order: (top, right, bottom, left)
+
+# Shared by every tracker: all pipelines of a DetectionService write "track:{id}" keys
+# into its one identity cache, so ids must not repeat across trackers
+_track_ids = itertools.count(1)
+
+def iou(a: BBox, b: BBox) -> float:
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    if bottom <= top or right <= left:
+        return 0.0
+    intersection = (bottom - top) * (right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return intersection / float(area_a + area_b - intersection)
+
+def centroid_distance(a: BBox, b: BBox) -> float:
+    """Distance between box centres, relative to the size of box ``a``"""
+    ay, ax = (a[0] + a[2]) / 2.0, (a[1] + a[3]) / 2.0
+    by, bx = (b[0] + b[2]) / 2.0, (b[1] + b[3]) / 2.0
+    size = max(1.0, np.sqrt(max(0, (a[2] - a[0]) * (a[1] - a[3]))))
+    return float(np.hypot(ay - by, ax - bx) / size)
+
+class Track:
+    """A face followed across frames, with constant-velocity bbox propagation"""
+
+    def __init__(self, track_id: int, bbox: BBox, frame_index: int):
+        self.track_id = track_id
+        self._bbox = np.asarray(bbox, dtype=np.float32)
+        self._velocity = np.zeros(4, dtype=np.float32)
+        self.last_detected_frame = frame_index
+        self.frame_index = frame_index
+        self.misses = 0
+        self.association_score = 1.0
+        self.verified_frame: Optional[int] = None
+        self.pending = False
+
+    @property
+    def bbox(self) -> BBox:
+        return tuple(int(round(v)) for v in self._bbox)
+
+    def correct(self, bbox: BBox, frame_index: int, score: float) -> None:
+        """Snap to a fresh detection and update the velocity estimate"""
+        measured = np.asarray(bbox, dtype=np.float32)
+        elapsed = frame_index - self.last_detected_frame
+        if elapsed > 0:
+            observed_velocity = (measured - self._bbox) / elapsed
+            self._velocity = 0.5 * self._velocity + 0.5 * observed_velocity
+        self._bbox = measured
+        self.last_detected_frame = frame_index
+        self.frame_index = frame_index
+        self.misses = 0
+        self.association_score = score
+
+    def propagate(self, frame_index: int) -> None:
+        """Move the box along its velocity to ``frame_index`` without running a detector"""
+        self._bbox = self._bbox + self._velocity * (frame_index - self.frame_index)
+        self.frame_index = frame_index
+
+class FaceTracker:
+    """Associates detections across frames by IoU, falling back to centroid distance"""
+
+    def __init__(self, iou_threshold: float = 0.3, max_centroid_distance: float = 0.5, max_missed: int = 3):
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.max_missed = max_missed
+        self.tracks: List[Track] = []
+
+    def get(self, track_id: int) -> Optional[Track]:
+        for track in self.tracks:
+            if track.track_id == track_id:
+                return track
+        return None
+
+    def update(self, detections: List[BBox], frame_index: int) -> Tuple[List[Track], List[Track]]:
+        """Associate a fresh set of detections; returns (live tracks, tracks that were dropped)"""
+        for track in self.tracks:
+            track.propagate(frame_index)
+
+        # Greedy assignment on descending score: IoU overlaps first, then centroid-only matches
+        candidates = []
+        for t, track in enumerate(self.tracks):
+            for d, detection in enumerate(detections):
+                overlap = iou(track.bbox, detection)
+                if overlap >= self.iou_threshold:
+                    candidates.append((1.0 + overlap, overlap, t, d))
+                else:
+                    distance = centroid_distance(track.bbox, detection)
+                    if distance <= self.max_centroid_distance:
+                        candidates.append((1.0 - distance, overlap, t, d))
+        candidates.sort(reverse=True)
+
+        matched_tracks, matched_detections = set(), set()
+        for _, overlap, t, d in candidates:
+            if t in matched_tracks or d in matched_detections:
+                continue
+            self.tracks[t].correct(detections[d], frame_index, overlap)
+            matched_tracks.add(t)
+            matched_detections.add(d)
+
+        dropped = []
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_missed:
+                    dropped.append(track)
+                    continue
+            survivors.append(track)
+
+        for d, detection in enumerate(detections):
+            if d not in matched_detections:
+                survivors.append(Track(next(_track_ids), detection, frame_index))
+
+        self.tracks = survivors
+        return self.tracks, dropped
+
+    def propagate(self, frame_index: int) -> List[Track]:
+        """Advance every track to ``frame_index`` between detections"""
+        for track in self.tracks:
+            track.propagate(frame_index)
+        return self.tracks
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, List, Optional
+from app.services.detection_service import DetectionService
+from app.metrics import FRAMES_DROPPED, stage_timer
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class LatestQueue:
+    """Bounded queue where a full queue drops its oldest item instead of blocking the producer"""
+
+    def __init__(self, maxsize: int = 1, on_drop: Optional[Callable[[Any], None]] = None, name: str = "subscriber"):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._on_drop = on_drop
+        self.name = name
+        self.dropped = 0
+
+    def put(self, item: Any) -> None:
+        if self._queue.full():
+            stale = self._queue.get_nowait()
+            self.dropped += 1
+            FRAMES_DROPPED.inc(self.name)
+            if self._on_drop is not None:
+                self._on_drop(stale)
+        self._queue.put_nowait(item)
+
+    async def get(self) -> Any:
+        return await self._queue.get()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+_END = object()
+
+class FramePipeline:
+    """Capture -> detect -> encode/match -> annotate -> JPEG, as independent stages.
+
+    Stages are linked by single-slot ``LatestQueue``s, so a slow stage only ever
+    sees the newest frame and never backs up the ones in front of it. Recognition
+    (detect, encode/match) runs on its own cadence while capture, annotate and
+    JPEG encode run at the camera rate; all blocking dlib/OpenCV calls happen in
+    executors or the face engine's worker pool so the event loop stays free.
+    """
+
+    def __init__(self, detection_service: DetectionService, source: Any = 0, loop_source: bool = False):
+        self.detection_service = detection_service
+        self.source = source
+        self.loop_source = loop_source
+        self.tracker = detection_service.create_tracker()
+        # Capture, annotate and JPEG encode each get a thread; dlib work goes to the face engine
+        self._executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="frame-pipeline")
+        self._capture: Optional[Any] = None  # cv2.VideoCapture, imported lazily
+        self._tasks: List[asyncio.Task] = []
+        self._detect_queue = LatestQueue(name="detect")
+        self._match_queue = LatestQueue(on_drop=lambda item: detection_service.release_targets(item[2]), name="match")
+        self._annotate_queue = LatestQueue(name="annotate")
+        self._jpeg_queue = LatestQueue(name="jpeg")
+        self._output_queue = LatestQueue(name="output")
+        self._last_detected_frame: Optional[int] = None
+
+    @property
+    def dropped_frames(self) -> int:
+        return sum(q.dropped for q in (
+            self._detect_queue, self._match_queue, self._annotate_queue, self._jpeg_queue, self._output_queue
+        ))
+
+    async def start(self) -> None:
+        import cv2
+
+        loop = asyncio.get_running_loop()
+        self._capture = await loop.run_in_executor(self._executor, cv2.VideoCapture, self.source)
+        if not self._capture.isOpened():
+            await self.stop()
+            raise RuntimeError(f"Could not open video source {self.source!r}")
+
+        self._tasks = [
+            asyncio.create_task(self._capture_stage()),
+            asyncio.create_task(self._detect_stage()),
+            asyncio.create_task(self._match_stage()),
+            asyncio.create_task(self._annotate_stage()),
+            asyncio.create_task(self._jpeg_stage()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._capture is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._capture.release)
+            self._capture = None
+        self._executor.shutdown(wait=False)
+
+    async def frames(self) -> AsyncIterator[bytes]:
+        """Yield JPEG-encoded annotated frames until the source ends"""
+        while True:
+            jpeg = await self._output_queue.get()
+            if jpeg is _END:
+                return
+            yield jpeg
+
+    async def _capture_stage(self) -> None:
+        import cv2
+
+        loop = asyncio.get_running_loop()
+        frame_interval = 1.0 / settings.pipeline_max_fps if settings.pipeline_max_fps > 0 else 0.0
+        if self.loop_source:
+            # Files decode faster than real time; replay them at their native rate
+            fps = await loop.run_in_executor(self._executor, self._capture.get, cv2.CAP_PROP_FPS)
+            if fps and fps > 0:
+                frame_interval = max(frame_interval, 1.0 / fps)
+        frame_index = 0
+        rewound = False
+        try:
+            while True:
+                started = time.monotonic()
+                with stage_timer("capture"):
+                    ret, frame = await loop.run_in_executor(self._executor, self._capture.read)
+                if not ret:
+                    if self.loop_source and frame_index > 0 and not rewound:
+                        await loop.run_in_executor(self._executor, self._capture.set, cv2.CAP_PROP_POS_FRAMES, 0)
+                        rewound = True
+                        continue
+                    break
+                rewound = False
+                frame_index += 1
+                self._detect_queue.put((frame_index, frame))
+                self._annotate_queue.put((frame_index, frame))
+
+                remaining = frame_interval - (time.monotonic() - started)
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+        finally:
+            self._annotate_queue.put(_END)
+
+    async def _detect_stage(self) -> None:
+        import cv2
+
+        loop = asyncio.get_running_loop()
+        service = self.detection_service
+        while True:
+            frame_index, frame = await self._detect_queue.get()
+            if (self._last_detected_frame is not None
+                    and frame_index - self._last_detected_frame < settings.detection_interval_frames):
+                continue
+            self._last_detected_frame = frame_index
+            try:
+                rgb_frame = await loop.run_in_executor(self._executor, cv2.cvtColor, frame, cv2.COLOR_BGR2RGB)
+                face_locations = await service.detect_faces(rgb_frame)
+            except Exception as e:
+                logger.exception("Error detecting faces: %s", e)
+                continue
+            targets = service.update_tracks(self.tracker, face_locations, frame_index)
+            if targets:
+                # Snapshot the boxes: the annotate stage keeps propagating the tracks while this waits
+                self._match_queue.put((frame_index, rgb_frame, targets, [track.bbox for track in targets]))
+
+    async def _match_stage(self) -> None:
+        while True:
+            frame_index, rgb_frame, targets, boxes = await self._match_queue.get()
+            await self.detection_service.identify_tracks(rgb_frame, frame_index, targets, boxes)
+
+    async def _annotate_stage(self) -> None:
+        loop = asyncio.get_running_loop()
+        service = self.detection_service
+        while True:
+            item = await self._annotate_queue.get()
+            if item is _END:
+                self._jpeg_queue.put(_END)
+                return
+            frame_index, frame = item
+            self.tracker.propagate(frame_index)
+            matches = service.tracked_matches(self.tracker)
+            if matches:
+                with stage_timer("annotate"):
+                    frame = await loop.run_in_executor(self._executor, service.annotate_frame, frame, matches)
+            self._jpeg_queue.put(frame)
+
+    async def _jpeg_stage(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            frame = await self._jpeg_queue.get()
+            if frame is _END:
+                self._output_queue.put(_END)
+                return
+            with stage_timer("jpeg_encode"):
+                ok, buffer = await loop.run_in_executor(self._executor, self._encode_jpeg, frame)
+            if ok:
+                self._output_queue.put(buffer.tobytes())
+
+    @staticmethod
+    def _encode_jpeg(frame: np.ndarray):
+        import cv2
+        return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, settings.pipeline_jpeg_quality])
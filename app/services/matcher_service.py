@@ -0,0 +1,112 @@
+import numpy as np
+import threading
+from typing import List, Dict, Any
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.repositories import FaceEmbeddingRepository
+
+class EmbeddingMatcher:
+    """In-RAM gallery matched with one matrix multiply per frame.
+
+    Rows are stored L2-normalised in a contiguous float32 matrix, so cosine
+    similarity (the same metric as pgvector's ``<=>``) is a plain dot product.
+    """
+
+    def __init__(self, dim: int = 128, initial_capacity: int = 1024):
+        self.dim = dim
+        self._matrix = np.zeros((initial_capacity, dim), dtype=np.float32)
+        self._user_ids: List[str] = []
+        self._names: List[str] = []
+        self._phones: List[str] = []
+        self._count = 0
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return self._count
+
+    async def load(self, session: AsyncSession) -> int:
+        """Replace the gallery with every embedding stored in the database"""
+        embedding_repo = FaceEmbeddingRepository(session)
+        rows = await embedding_repo.get_all_embeddings_with_users()
+
+        # The binary codec hands back float32 arrays, so one asarray stacks them
+        matrix = np.zeros((max(len(rows), 1024), self.dim), dtype=np.float32)
+        if rows:
+            matrix[:len(rows)] = np.asarray([row["embedding"] for row in rows], dtype=np.float32)
+        self._normalize(matrix[:len(rows)])
+
+        with self._lock:
+            self._matrix = matrix
+            self._user_ids = [row["user_id"] for row in rows]
+            self._names = [row["name"] for row in rows]
+            self._phones = [row["phone_number"] for row in rows]
+            self._count = len(rows)
+            self.loaded = True
+        return self._count
+
+    def add(self, user_id: str, name: str, phone_number: str, embedding: np.ndarray) -> None:
+        """Append a newly enrolled embedding without reloading the gallery"""
+        row = np.asarray(embedding, dtype=np.float32).reshape(1, self.dim).copy()
+        self._normalize(row)
+
+        with self._lock:
+            if self._count == len(self._matrix):
+                # Grow geometrically; readers keep their snapshot of the old buffer
+                grown = np.zeros((len(self._matrix) * 2, self.dim), dtype=np.float32)
+                grown[:self._count] = self._matrix[:self._count]
+                self._matrix = grown
+            self._matrix[self._count] = row[0]
+            self._user_ids.append(user_id)
+            self._names.append(name)
+            self._phones.append(phone_number)
+            self._count += 1
+
+    def match(self, encodings: List[np.ndarray], threshold: float = 0.6, limit: int = 5) -> List[List[Dict[str, Any]]]:
+        """Return the top ``limit`` matches above ``threshold`` for every encoding, in input order.
+
+        CPU-bound on large galleries; async callers run it in an executor (NumPy releases the GIL).
+        """
+        with self._lock:
+            count = self._count
+            gallery = self._matrix[:count]
+            user_ids, names, phones = self._user_ids, self._names, self._phones
+
+        if not encodings:
+            return []
+        if count == 0:
+            return [[] for _ in encodings]
+
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim).copy()
+        self._normalize(queries)
+        similarities = queries @ gallery.T
+
+        k = min(limit, count)
+        if k < count:
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(count), (len(queries), count))
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        results = []
+        for indices, scores in zip(top, top_scores):
+            results.append([
+                {
+                    "user_id": user_ids[i],
+                    "name": names[i],
+                    "phone_number": phones[i],
+                    "similarity": float(score)
+                }
+                for i, score in zip(indices, scores)
+                if score > threshold
+            ])
+        return results
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> None:
+        """L2-normalise rows in place"""
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
@@ -0,0 +1,158 @@
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from typing import Any, Dict, List, Optional
+from app.services.cache_service import CacheCodec, CacheService
+
+_MATCH = struct.Struct("<fHHHH")  # similarity, user_id/name/phone/embedding lengths
+
+def pack_match(entry: Dict[str, Any]) -> bytes:
+    """A match plus the (normalised) embedding it was found for; the embedding is stored as float16"""
+    user_id = entry['user_id'].encode()
+    name = entry['name'].encode()
+    phone = (entry.get('phone_number') or '').encode()
+    embedding = np.asarray(entry['embedding'], dtype=np.float16).tobytes()
+    header = _MATCH.pack(entry['similarity'], len(user_id), len(name), len(phone), len(embedding))
+    return header + user_id + name + phone + embedding
+
+def unpack_match(data: bytes) -> Dict[str, Any]:
+    similarity, user_id_length, name_length, phone_length, embedding_length = _MATCH.unpack_from(data)
+    offset = _MATCH.size
+    fields = []
+    for length in (user_id_length, name_length, phone_length):
+        fields.append(data[offset:offset + length].decode())
+        offset += length
+    embedding = np.frombuffer(data[offset:offset + embedding_length], dtype=np.float16).astype(np.float32)
+    return {
+        'user_id': fields[0],
+        'name': fields[1],
+        'phone_number': fields[2],
+        'similarity': round(similarity, 6),
+        'embedding': embedding,
+    }
+
+MATCH_CODEC = CacheCodec(pack_match, unpack_match)
+
+class RecentIdentityCache:
+    """Identities matched in the last few seconds, looked up by embedding.
+
+    A person in front of the camera yields a slightly different embedding on
+    every frame, so exact keys never repeat; a new embedding within
+    ``tolerance`` (cosine distance) of a recent match reuses that match. Local
+    entries sit in one normalised float32 matrix and a batch is checked with a
+    single matrix multiply. With a ``shared`` cache (a shm or redis backend),
+    matches are also published under a random-hyperplane LSH bucket so other
+    workers find them. A bucket has ``bucket_entries`` slots, picked by user,
+    so different people hashing to the same bucket rarely overwrite each
+    other. A near-duplicate can still fall on the other side of a hyperplane,
+    so lookups also probe the ``lsh_probes`` neighbouring buckets whose
+    hyperplanes pass closest to the query.
+    """
+
+    def __init__(self, max_size: int = 256, ttl_seconds: float = 30.0, tolerance: float = 0.03,
+                 dim: int = 128, shared: Optional[CacheService] = None, lsh_bits: int = 8,
+                 bucket_entries: int = 4, lsh_probes: int = 2):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.tolerance = tolerance
+        self.dim = dim
+        self.shared = shared
+        self.bucket_entries = max(1, bucket_entries)
+        self.lsh_probes = max(0, min(lsh_probes, lsh_bits))
+        self._matrix = np.zeros((max_size, dim), dtype=np.float32)
+        self._expires = np.zeros(max_size, dtype=np.float64)  # 0 marks an empty slot
+        self._matches: List[Optional[Dict[str, Any]]] = [None] * max_size
+        self._next = 0
+        self._lock = threading.Lock()
+        # Fixed seed: every worker must derive the same buckets
+        self._planes = np.random.default_rng(0x5EED).standard_normal((lsh_bits, dim)).astype(np.float32)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _buckets(self, vector: np.ndarray, probes: int = 0) -> List[int]:
+        """The vector's LSH bucket, then its neighbours across the ``probes`` closest hyperplanes"""
+        projections = self._planes @ vector
+        bucket = sum(1 << i for i, projection in enumerate(projections) if projection >= 0)
+        closest = np.argsort(np.abs(projections))[:probes]
+        return [bucket] + [bucket ^ (1 << int(i)) for i in closest]
+
+    def _slot_key(self, bucket: int, slot: int) -> str:
+        return f"recent:{bucket}:{slot}"
+
+    def _user_slot(self, user_id: str) -> int:
+        # crc32 rather than hash(): every worker must pick the same slot for a user
+        return zlib.crc32(user_id.encode()) % self.bucket_entries
+
+    def _insert(self, vector: np.ndarray, match: Dict[str, Any], expires_at: float) -> None:
+        with self._lock:
+            slot = self._next
+            self._next = (slot + 1) % self.max_size
+            self._matrix[slot] = vector
+            self._expires[slot] = expires_at
+            self._matches[slot] = match
+
+    def lookup(self, encodings: List[np.ndarray]) -> List[Optional[Dict[str, Any]]]:
+        """The cached match for each encoding, or None; results carry no embedding"""
+        if not encodings or self.max_size == 0:
+            return [None] * len(encodings)
+        queries = self._normalize(np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim))
+        now = time.monotonic()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        with self._lock:
+            live = self._expires > now
+            if live.any():
+                similarities = queries @ self._matrix.T
+                similarities[:, ~live] = -np.inf
+                best = similarities.argmax(axis=1)
+                for i, slot in enumerate(best):
+                    if 1.0 - similarities[i, slot] <= self.tolerance:
+                        results[i] = self._matches[slot]
+
+        if self.shared is not None:
+            for i, query in enumerate(queries):
+                if results[i] is not None:
+                    continue
+                best, best_similarity = None, 1.0 - self.tolerance
+                for bucket in self._buckets(query, self.lsh_probes):
+                    for slot in range(self.bucket_entries):
+                        entry = self.shared.get(self._slot_key(bucket, slot))
+                        if entry is None:
+                            continue
+                        neighbour = self._normalize(entry['embedding'].reshape(1, -1))[0]
+                        similarity = float(query @ neighbour)
+                        if similarity >= best_similarity:
+                            match = {key: value for key, value in entry.items() if key != 'embedding'}
+                            best, best_similarity = (neighbour, match), similarity
+                if best is not None:
+                    results[i] = best[1]
+                    self._insert(best[0], best[1], now + self.ttl_seconds)
+        return results
+
+    def remember(self, encodings: List[np.ndarray], matches: List[Optional[Dict[str, Any]]]) -> None:
+        """Record fresh search results; unknown faces are not cached so new enrollments show up at once"""
+        if self.max_size == 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds
+        for encoding, match in zip(encodings, matches):
+            if match is None:
+                continue
+            vector = self._normalize(np.asarray(encoding, dtype=np.float32).reshape(1, self.dim))[0]
+            match = {key: match[key] for key in ('user_id', 'name', 'phone_number', 'similarity')}
+            self._insert(vector, match, expires_at)
+            if self.shared is not None:
+                key = self._slot_key(self._buckets(vector)[0], self._user_slot(match['user_id']))
+                self.shared.set(key, {**match, 'embedding': vector})
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires[:] = 0.0
+            self._matches = [None] * self.max_size
+
+    def size(self) -> int:
+        with self._lock:
+            return int((self._expires > time.monotonic()).sum())
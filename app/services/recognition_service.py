@@ -0,0 +1,117 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from app.services.detection_service import DetectionService
+from app.services.face_service import FaceService
+from app.metrics import registry, stage_timer
+from app.config import settings
+
+BATCH_SIZE = registry.histogram(
+    "face_micro_batch_size",
+    "Items per cross-client micro-batch",
+    ["batcher"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+class MicroBatcher:
+    """Groups items submitted by many callers into one ``handler`` call.
+
+    A batch is flushed when it reaches ``max_size`` or ``max_delay`` seconds after
+    its first item arrived, whichever comes first; each caller awaits its own
+    result. ``handler`` takes the list of items and returns results in order.
+    """
+
+    def __init__(self, name: str, handler: Callable[[List[Any]], Awaitable[List[Any]]], max_size: int, max_delay: float):
+        self.name = name
+        self.handler = handler
+        self.max_size = max(1, max_size)
+        self.max_delay = max_delay
+        self._items: List[Any] = []
+        self._futures: List[asyncio.Future] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()  # the loop only holds weak references to running tasks
+
+    async def submit(self, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._items.append(item)
+        self._futures.append(future)
+        if len(self._items) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, futures = self._items, self._futures
+        self._items, self._futures = [], []
+        if items:
+            # Run the batch in its own task so the next one can start filling meanwhile
+            task = asyncio.create_task(self._run(items, futures))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, items: List[Any], futures: List[asyncio.Future]) -> None:
+        BATCH_SIZE.observe(len(items), self.name)
+        try:
+            results = await self.handler(items)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+class RecognitionService:
+    """Recognition for frames pushed by clients, batched across every connected client.
+
+    Decode/detect/encode of all frames that arrive within the batching window go
+    to the face engine together, and all resulting encodings are matched with one
+    vector search instead of one per face.
+    """
+
+    def __init__(self, detection_service: DetectionService, face_service: FaceService):
+        self.detection_service = detection_service
+        self.face_service = face_service
+        max_delay = settings.ws_batch_max_delay_ms / 1000.0
+        self._analyze = MicroBatcher("analyze", self.face_service.analyze_images, settings.ws_batch_max_size, max_delay)
+        self._match = MicroBatcher("match", self.detection_service.match_encodings, settings.ws_batch_max_size, max_delay)
+
+    async def recognize(self, image_bytes: bytes, cropped: bool = False) -> List[Dict[str, Any]]:
+        """``{bbox, user_id, name, confidence[, skipped]}`` for every face in a compressed frame (or one cropped face)"""
+        with stage_timer("ws_analyze"):
+            faces, error = await self._analyze.submit((image_bytes, cropped))
+        if error is not None:
+            raise ValueError(error)
+        if not faces:
+            return []
+
+        with stage_timer("ws_match"):
+            matches = await asyncio.gather(*(
+                self._match.submit(encoding) if encoding is not None else self._skipped()
+                for _, encoding, _ in faces
+            ))
+        return [self._describe(bbox, best, reason) for (bbox, _, reason), best in zip(faces, matches)]
+
+    @staticmethod
+    async def _skipped() -> None:
+        return None
+
+    @staticmethod
+    def _describe(bbox: Tuple[int, int, int, int], best: Optional[Dict[str, Any]],
+                  skip_reason: Optional[str] = None) -> Dict[str, Any]:
+        if skip_reason is not None:
+            # Not encoded: too small, dark, blurred or turned away to identify reliably
+            return {'bbox': [int(v) for v in bbox], 'user_id': None, 'name': 'Unknown', 'confidence': 0.0,
+                    'skipped': skip_reason}
+        if best is None:
+            return {'bbox': [int(v) for v in bbox], 'user_id': None, 'name': 'Unknown', 'confidence': 0.0}
+        return {
+            'bbox': [int(v) for v in bbox],
+            'user_id': best['user_id'],
+            'name': best['name'],
+            'confidence': float(best['similarity'])
+        }
@@ -0,0 +1,135 @@
+import asyncio
+import os
+from typing import Dict, List, Optional, Set, Union
+from urllib.parse import urlsplit, urlunsplit
+from app.services.detection_service import DetectionService
+from app.services.frame_pipeline import FramePipeline, LatestQueue
+from app.config import settings
+
+URL_SCHEMES = ("rtsp://", "rtsps://", "http://", "https://")
+
+def parse_source(source: str) -> Union[int, str]:
+    """Camera index for digits, otherwise a stream URL or a video file path"""
+    source = source.strip()
+    if source.isdigit():
+        return int(source)
+    return source
+
+def is_file_source(source: Union[int, str]) -> bool:
+    return isinstance(source, str) and not source.lower().startswith(URL_SCHEMES) and os.path.isfile(source)
+
+def allowed_sources() -> List[str]:
+    return [source.strip() for source in settings.video_sources.split(",") if source.strip()]
+
+def display_name(source: str) -> str:
+    """The source with URL credentials masked (rtsp://***@host/...), safe to expose or use as a label"""
+    parts = urlsplit(source)
+    if not parts.scheme or "@" not in parts.netloc:
+        return source
+    return urlunsplit(parts._replace(netloc="***@" + parts.netloc.rsplit("@", 1)[1]))
+
+def resolve_source(name: str) -> Optional[str]:
+    """The configured source a viewer asked for, by its raw value or its display name"""
+    for source in allowed_sources():
+        if name in (source, display_name(source)):
+            return source
+    return None
+
+class StreamWorker:
+    """One capture + recognition pipeline per source, broadcasting JPEG frames to every subscriber.
+
+    Each subscriber gets its own single-slot ``LatestQueue``: a slow client only
+    ever misses frames, it never holds up the worker or the other clients.
+    """
+
+    def __init__(self, source: str, detection_service: DetectionService, on_stopped=None):
+        self.source = source
+        parsed = parse_source(source)
+        self.pipeline = FramePipeline(
+            detection_service,
+            source=parsed,
+            loop_source=settings.video_file_loop and is_file_source(parsed)
+        )
+        self.subscribers: Set[LatestQueue] = set()
+        self._on_stopped = on_stopped
+        self._task: Optional[asyncio.Task] = None
+        self._idle_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await self.pipeline.start()
+        self._task = asyncio.create_task(self._broadcast())
+
+    def subscribe(self) -> LatestQueue:
+        if self._idle_task is not None:
+            self._idle_task.cancel()
+            self._idle_task = None
+        queue = LatestQueue(maxsize=settings.stream_subscriber_buffer)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: LatestQueue) -> None:
+        self.subscribers.discard(queue)
+        if not self.subscribers and self._idle_task is None and self._task is not None:
+            # Keep the source warm briefly so a reconnecting viewer does not reopen the camera
+            self._idle_task = asyncio.create_task(self._stop_when_idle())
+
+    async def _stop_when_idle(self) -> None:
+        await asyncio.sleep(settings.stream_idle_timeout_seconds)
+        if not self.subscribers:
+            await self.stop()
+
+    async def _broadcast(self) -> None:
+        try:
+            async for jpeg in self.pipeline.frames():
+                for queue in list(self.subscribers):
+                    queue.put(jpeg)
+        finally:
+            # None tells subscribers the source has ended
+            for queue in list(self.subscribers):
+                queue.put(None)
+            await self.pipeline.stop()
+            if self._on_stopped is not None:
+                self._on_stopped(self)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+class StreamHub:
+    """Registry of running StreamWorkers, keyed by source"""
+
+    def __init__(self, detection_service: DetectionService):
+        self.detection_service = detection_service
+        self._workers: Dict[str, StreamWorker] = {}
+        self._lock = asyncio.Lock()
+
+    async def subscribe(self, source: str) -> LatestQueue:
+        async with self._lock:
+            worker = self._workers.get(source)
+            if worker is None:
+                worker = StreamWorker(source, self.detection_service, on_stopped=self._forget)
+                await worker.start()
+                self._workers[source] = worker
+            return worker.subscribe()
+
+    def unsubscribe(self, source: str, queue: LatestQueue) -> None:
+        worker = self._workers.get(source)
+        if worker is not None:
+            worker.unsubscribe(queue)
+
+    def _forget(self, worker: StreamWorker) -> None:
+        if self._workers.get(worker.source) is worker:
+            del self._workers[worker.source]
+
+    def stats(self) -> Dict[str, dict]:
+        """Per running source, keyed by display name"""
+        return {
+            display_name(source): {"subscribers": len(worker.subscribers), "dropped_frames": worker.pipeline.dropped_frames}
+            for source, worker in self._workers.items()
+        }
+
+    async def stop_all(self) -> None:
+        for worker in list(self._workers.values()):
+            await worker.stop()
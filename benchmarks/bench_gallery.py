@@ -0,0 +1,178 @@
+import io
+import time
+import uuid
+import numpy as np
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+from benchmarks.stats import measure_async, synthetic_embeddings
+
+IMAGES_PER_USER = 2
+LOAD_CHUNK_ROWS = 50_000
+
+def _vector_lines(rows: np.ndarray) -> List[str]:
+    buffer = io.StringIO()
+    np.savetxt(buffer, rows, fmt="%.6f", delimiter=",")
+    return [f"[{line}]" for line in buffer.getvalue().splitlines()]
+
+async def load_gallery(size: int, seed: int = 0) -> np.ndarray:
+    """Replace the benchmark database's gallery with ``size`` synthetic embeddings; returns the user centres"""
+    from sqlalchemy import text
+    from app.database.connection import engine, create_tables, backfill_prototypes
+
+    await create_tables()
+    users = max(1, size // IMAGES_PER_USER)
+    centres = synthetic_embeddings(users, seed=seed)
+    user_ids = [str(uuid.UUID(int=i + 1)) for i in range(users)]
+
+    async with engine.connect() as conn:
+        await conn.execute(text("TRUNCATE users, face_embeddings, user_prototypes RESTART IDENTITY"))
+        # Drop the indexes so the load is a plain COPY; create_tables() rebuilds them afterwards
+        await _drop_indexes(conn)
+        await conn.commit()
+
+        raw_connection = await conn.get_raw_connection()
+        driver = raw_connection.driver_connection
+        user_rows = "".join(f"{user_id}\tBench user {i}\t555-{i:07d}\n" for i, user_id in enumerate(user_ids))
+        await driver.copy_to_table(
+            "users", source=io.BytesIO(user_rows.encode()), columns=["user_id", "name", "phone_number"], format="text"
+        )
+
+        rng = np.random.default_rng(seed + 1)
+        for start in range(0, size, LOAD_CHUNK_ROWS):
+            count = min(LOAD_CHUNK_ROWS, size - start)
+            owners = (np.arange(start, start + count) // IMAGES_PER_USER) % users
+            rows = centres[owners] + rng.normal(0.0, 0.02, size=(count, centres.shape[1])).astype(np.float32)
+            lines = "".join(
+                f"{user_ids[owner]}\t{vector}\n" for owner, vector in zip(owners, _vector_lines(rows))
+            )
+            await driver.copy_to_table(
+                "face_embeddings", source=io.BytesIO(lines.encode()), columns=["user_id", "embedding"], format="text"
+            )
+        await backfill_prototypes(conn)
+        await conn.commit()
+        await driver.execute("ANALYZE users; ANALYZE face_embeddings; ANALYZE user_prototypes")
+    return centres
+
+async def _drop_indexes(conn) -> None:
+    from sqlalchemy import text
+    from app.database.vector_index import VECTOR_TABLES, index_name
+
+    for table in VECTOR_TABLES:
+        await conn.execute(text(f"DROP INDEX IF EXISTS {index_name(table)}"))
+
+def _recall(approximate: List[List[str]], exact: List[List[str]]) -> Dict[str, float]:
+    """recall@k of the approximate user ids against the exact ones, and top-1 agreement"""
+    recall, top1 = [], []
+    for found, truth in zip(approximate, exact):
+        hits = sum((Counter(found) & Counter(truth)).values())
+        recall.append(hits / len(truth) if truth else 1.0)
+        top1.append(found[:1] == truth[:1])
+    return {"recall_at_k": float(np.mean(recall)), "top1_agreement": float(np.mean(top1))}
+
+async def _rebuild_index(quantization: str) -> Optional[dict]:
+    from app.database.connection import create_tables, engine
+    from app.database.vector_index import get_vector_index_info
+    from app.config import settings
+
+    settings.vector_quantization = quantization
+    async with engine.connect() as conn:
+        await _drop_indexes(conn)
+        await conn.commit()
+    await create_tables()  # builds the configured ANN indexes
+    async with engine.connect() as conn:
+        return await get_vector_index_info(conn)
+
+async def run(sizes: List[int], queries: int = 200, batch: int = 8, reuse: bool = False,
+              quantizations: Sequence[str] = ("none",)) -> Dict[str, Any]:
+    """Latency per gallery size and, per quantization with and without prototype search,
+    index size and recall against an exact search"""
+    from sqlalchemy import text
+    from app.database.connection import async_session, engine
+    from app.database.repositories import FaceEmbeddingRepository
+    from app.services.matcher_service import EmbeddingMatcher
+    from app.config import settings
+
+    configured_quantization = settings.vector_quantization
+    configured_prototype_search = settings.prototype_search
+    results: Dict[str, Any] = {}
+    for size in sizes:
+        stage: Dict[str, Any] = {}
+        async with engine.connect() as conn:
+            existing = (await conn.execute(text("SELECT count(*) FROM face_embeddings"))).scalar_one() \
+                if reuse else -1
+
+        started = time.perf_counter()
+        if existing == size:
+            centres = synthetic_embeddings(max(1, size // IMAGES_PER_USER), seed=size)
+        else:
+            centres = await load_gallery(size, seed=size)
+        stage["load_seconds"] = time.perf_counter() - started
+
+        probes = synthetic_embeddings(queries * batch, seed=size + 7, base=centres)
+        position = iter(range(10 ** 12))
+        threshold = settings.face_recognition_tolerance
+
+        # The in-memory matcher is an exact search, so it doubles as ground truth for recall
+        async with async_session() as session:
+            matcher = EmbeddingMatcher()
+            started = time.perf_counter()
+            await matcher.load(session)
+            stage["memory_load_seconds"] = time.perf_counter() - started
+        limit = settings.matcher_top_k
+        exact_rows = [
+            [match["user_id"] for match in matches]
+            for matches in matcher.match(list(probes[:queries]), threshold, limit=limit * IMAGES_PER_USER)
+        ]
+        # Row search may return a user once per image; prototype search returns each user once
+        exact = {
+            False: [user_ids[:limit] for user_ids in exact_rows],
+            True: [list(dict.fromkeys(user_ids))[:limit] for user_ids in exact_rows],
+        }
+
+        stage["pgvector"] = {}
+        for quantization in quantizations:
+            started = time.perf_counter()
+            index = await _rebuild_index(quantization)
+            build_seconds = time.perf_counter() - started
+
+            for prototype_search in (False, True):
+                settings.prototype_search = prototype_search
+                variant: Dict[str, Any] = {"index": index, "index_build_seconds": build_seconds}
+                async with async_session() as session:
+                    repo = FaceEmbeddingRepository(session)
+                    approximate = [
+                        [user_id for user_id, _ in await repo.find_similar_faces(probe, threshold, limit)]
+                        for probe in probes[:queries]
+                    ]
+                    variant.update(_recall(approximate, exact[prototype_search]))
+                    variant["single"] = await measure_async(
+                        lambda: repo.find_similar_faces(probes[next(position) % len(probes)], threshold, limit),
+                        queries
+                    )
+                    variant[f"batch_{batch}"] = await measure_async(
+                        lambda: repo.find_similar_faces_batch(
+                            list(probes[(next(position) % queries) * batch:][:batch]), threshold, limit
+                        ),
+                        queries,
+                        items_per_sample=batch
+                    )
+                key = f"{quantization}+prototypes" if prototype_search else quantization
+                stage["pgvector"][key] = variant
+        settings.vector_quantization = configured_quantization
+        settings.prototype_search = configured_prototype_search
+
+        stage[f"memory_match_{batch}"] = await measure_async(
+            _as_async(lambda: matcher.match(
+                list(probes[(next(position) % queries) * batch:][:batch]),
+                threshold=threshold
+            )),
+            queries,
+            items_per_sample=batch
+        )
+        results[str(size)] = stage
+    return results
+
+def _as_async(fn):
+    async def wrapper():
+        return fn()
+    return wrapper
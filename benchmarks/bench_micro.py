@@ -0,0 +1,48 @@
+import numpy as np
+from typing import Any, Dict
+from benchmarks.stats import measure, synthetic_embeddings
+
+def run(iterations: int = 10000) -> Dict[str, Any]:
+    """Micro-benchmarks for the per-frame helpers that do not need a database or camera"""
+    from app.services.cache_service import CacheService
+    from app.services.detection_service import DetectionService
+    from app.database.repositories import FaceEmbeddingRepository
+    from app.database.vector_codec import encode_vector, decode_vector
+    from app.config import settings
+
+    results: Dict[str, Any] = {}
+
+    # Cache at capacity, so every set also evicts
+    cache = CacheService(
+        max_size=settings.max_cache_size,
+        ttl_seconds=settings.cache_ttl_seconds,
+        num_shards=settings.cache_shards,
+        sweep_interval_seconds=settings.cache_sweep_interval_seconds
+    )
+    value = {'name': 'bench', 'phone': '000', 'confidence': 0.9}
+    for i in range(settings.max_cache_size):
+        cache.set(f"track:{i}", value)
+    keys = [f"track:{i % settings.max_cache_size}" for i in range(iterations)]
+    counter = iter(range(10 ** 12))
+
+    results["cache_get_hit"] = measure(lambda: cache.get(keys[next(counter) % iterations]), iterations)
+    results["cache_get_miss"] = measure(lambda: cache.get("absent"), iterations)
+    results["cache_set_evict"] = measure(lambda: cache.set(f"new:{next(counter)}", value), iterations)
+
+    embedding = synthetic_embeddings(1)[0].astype(np.float64)
+    results["numpy_to_pgvector"] = measure(lambda: FaceEmbeddingRepository.numpy_to_pgvector(embedding), iterations)
+    results["vector_encode_binary"] = measure(lambda: encode_vector(embedding), iterations)
+    encoded = encode_vector(embedding)
+    results["vector_decode_binary"] = measure(lambda: decode_vector(encoded), iterations)
+
+    frame = np.random.default_rng(0).integers(0, 255, size=(720, 1280, 3), dtype=np.uint8)
+    matches = [
+        {'bbox': (100 + 150 * i, 200 + 150 * i, 240 + 150 * i, 60 + 150 * i),
+         'name': f"Person {i}", 'phone': '555-0100', 'confidence': 0.8}
+        for i in range(4)
+    ]
+    detection_service = DetectionService()
+    results["annotate_frame_4_faces"] = measure(
+        lambda: detection_service.annotate_frame(frame, matches), max(100, iterations // 50), items_per_sample=1
+    )
+    return results
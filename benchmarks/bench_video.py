@@ -0,0 +1,111 @@
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Optional
+from benchmarks.stats import summarize
+
+def write_synthetic_video(path: str, frames: int = 300, size=(1280, 720), fps: int = 30,
+                          face_image: Optional[str] = None) -> str:
+    """Noise background with an optional face photo sliding across it, so detection has work to do"""
+    width, height = size
+    rng = np.random.default_rng(0)
+    background = rng.integers(40, 200, size=(height, width, 3), dtype=np.uint8)
+    face = None
+    if face_image:
+        face = cv2.imread(face_image)
+        scale = (height / 2) / face.shape[0]
+        face = cv2.resize(face, None, fx=scale, fy=scale)
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    for i in range(frames):
+        frame = background.copy()
+        if face is not None:
+            fh, fw = face.shape[:2]
+            x = int((width - fw) * (0.5 + 0.4 * np.sin(i / 30.0)))
+            y = (height - fh) // 2
+            frame[y:y + fh, x:x + fw] = face
+        writer.write(frame)
+    writer.release()
+    return path
+
+def read_frames(path: str, limit: int) -> List[np.ndarray]:
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+async def run(video: Optional[str] = None, frames: int = 300, face_image: Optional[str] = None) -> Dict[str, Any]:
+    """Replay a recorded or synthetic video through process_frame and through each stage separately.
+
+    Matching queries the benchmark database (or the in-memory gallery loaded from it).
+    """
+    from app.services.detection_service import DetectionService
+    from app.database.connection import create_tables
+    from app.config import settings
+
+    created = None
+    if video is None:
+        created = video = write_synthetic_video(
+            os.path.join(tempfile.mkdtemp(prefix="bench-video-"), "synthetic.avi"), frames, face_image=face_image
+        )
+    try:
+        clip = read_frames(video, frames)
+    finally:
+        if created:
+            os.remove(created)
+
+    await create_tables()
+    service = DetectionService()
+    await service.load_gallery()
+    samples: Dict[str, List[float]] = {
+        "process_frame": [], "detect": [], "encode": [], "match": [], "annotate": [], "jpeg_encode": []
+    }
+
+    # End to end: the tracker decides when detection and recognition actually run. Recognition
+    # runs in the background in the app; here each frame waits for it so its cost is counted
+    for frame in clip:
+        started = time.perf_counter()
+        await service.process_frame(frame)
+        await service.wait_for_recognition()
+        samples["process_frame"].append(time.perf_counter() - started)
+
+    # Per stage, on every frame
+    faces = 0
+    for frame in clip:
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        started = time.perf_counter()
+        locations = await service.detect_faces(rgb_frame)
+        samples["detect"].append(time.perf_counter() - started)
+
+        if locations:
+            faces += len(locations)
+            started = time.perf_counter()
+            encodings = await service.face_service.extract_face_encodings(rgb_frame, locations)
+            samples["encode"].append(time.perf_counter() - started)
+
+            if encodings:
+                started = time.perf_counter()
+                await service.search_encodings(encodings)
+                samples["match"].append(time.perf_counter() - started)
+
+        matches = [{'bbox': location, 'name': 'Bench', 'phone': '', 'confidence': 0.9} for location in locations]
+        started = time.perf_counter()
+        annotated = service.annotate_frame(frame, matches)
+        samples["annotate"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        cv2.imencode('.jpg', annotated, [cv2.IMWRITE_JPEG_QUALITY, settings.pipeline_jpeg_quality])
+        samples["jpeg_encode"].append(time.perf_counter() - started)
+
+    results = {name: summarize(values) for name, values in samples.items()}
+    results["frames"] = len(clip)
+    results["faces_detected"] = faces
+    results["resolution"] = list(clip[0].shape[:2]) if clip else None
+    return results
@@ -0,0 +1,107 @@
+"""Reproducible benchmarks for the recognition hot paths; prints or writes one JSON document.
+
+    python -m benchmarks.run --suites micro,video
+    python -m benchmarks.run --suites gallery --gallery-sizes 10000,100000,1000000 --output bench.json
+
+The gallery and video suites need a local pgvector instance. They use a
+separate ``<database>_bench`` database (created if missing), never the
+application database; the gallery suite truncates and reloads its tables.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+def bench_database_url(database_url: str) -> str:
+    parts = urlsplit(database_url)
+    name = parts.path.lstrip("/")
+    if not name.endswith("_bench"):
+        name = f"{name}_bench"
+    return urlunsplit(parts._replace(path=f"/{name}"))
+
+async def ensure_database(database_url: str) -> None:
+    import asyncpg
+    parts = urlsplit(database_url.replace("+asyncpg", ""))
+    name = parts.path.lstrip("/")
+    admin = await asyncpg.connect(urlunsplit(parts._replace(path="/postgres")))
+    try:
+        if not await admin.fetchval("SELECT 1 FROM pg_database WHERE datname = $1", name):
+            await admin.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        await admin.close()
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+async def run(args: argparse.Namespace) -> dict:
+    suites = [suite.strip() for suite in args.suites.split(",") if suite.strip()]
+    if "gallery" in suites or "video" in suites:
+        await ensure_database(os.environ["DATABASE_URL"])
+
+    from app.config import settings
+    from app.services.face_engine import shutdown_face_engine
+    from benchmarks import bench_gallery, bench_micro, bench_video
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": settings.model_dump(exclude={"database_url", "secret_key"}),
+        "results": {},
+    }
+    try:
+        if "micro" in suites:
+            report["results"]["micro"] = bench_micro.run(args.iterations)
+        if "video" in suites:
+            report["results"]["video"] = await bench_video.run(args.video, args.frames, args.face_image)
+        if "gallery" in suites:
+            sizes = [int(size) for size in args.gallery_sizes.split(",")]
+            quantizations = [q.strip() for q in args.quantizations.split(",") if q.strip()]
+            report["results"]["gallery"] = await bench_gallery.run(
+                sizes, args.queries, args.batch, args.reuse, quantizations
+            )
+    finally:
+        shutdown_face_engine()
+    return report
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", default="micro,video,gallery", help="comma separated: micro, video, gallery")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--iterations", type=int, default=10000, help="micro-benchmark iterations")
+    parser.add_argument("--video", help="recorded video to replay; a synthetic clip is generated otherwise")
+    parser.add_argument("--face-image", help="face photo to animate in the synthetic clip")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--gallery-sizes", default="10000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=8, help="faces per frame for the batched searches")
+    parser.add_argument("--quantizations", default="none,halfvec,binary",
+                        help="index variants to compare for recall, index size and latency")
+    parser.add_argument("--reuse", action="store_true", help="keep an already loaded gallery of the same size")
+    args = parser.parse_args()
+
+    # Point the app at the benchmark database before any app module builds its engine
+    from app.config import settings
+    os.environ["DATABASE_URL"] = bench_database_url(os.environ.get("DATABASE_URL", settings.database_url))
+    settings.database_url = os.environ["DATABASE_URL"]
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import time
+import numpy as np
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+def summarize(samples: List[float], items_per_sample: int = 1) -> Dict[str, Any]:
+    """Latency percentiles (ms) and throughput (items/s) for a list of per-call durations in seconds"""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples, dtype=np.float64)
+    total = float(values.sum())
+    return {
+        "count": len(samples),
+        "items_per_sample": items_per_sample,
+        "throughput_per_s": (len(samples) * items_per_sample / total) if total > 0 else None,
+        "mean_ms": float(values.mean() * 1000),
+        "p50_ms": float(np.percentile(values, 50) * 1000),
+        "p95_ms": float(np.percentile(values, 95) * 1000),
+        "p99_ms": float(np.percentile(values, 99) * 1000),
+        "max_ms": float(values.max() * 1000),
+    }
+
+def measure(fn: Callable[[], Any], iterations: int, warmup: int = 10, items_per_sample: int = 1) -> Dict[str, Any]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, items_per_sample)
+
+async def measure_async(fn: Callable[[], Awaitable[Any]], iterations: int, warmup: int = 5,
+                        items_per_sample: int = 1) -> Dict[str, Any]:
+    for _ in range(warmup):
+        await fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, items_per_sample)
+
+def synthetic_embeddings(count: int, dim: int = 128, seed: int = 0, base: Optional[np.ndarray] = None) -> np.ndarray:
+    """dlib-like 128-d encodings: small signed components, optionally jittered around ``base`` rows"""
+    rng = np.random.default_rng(seed)
+    if base is None:
+        return rng.normal(0.0, 0.09, size=(count, dim)).astype(np.float32)
+    rows = base[rng.integers(0, len(base), size=count)]
+    return (rows + rng.normal(0.0, 0.02, size=rows.shape)).astype(np.float32)
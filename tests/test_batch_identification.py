@@ -0,0 +1,108 @@
+import asyncio
+import json
+import os
+import types
+import numpy as np
+import pytest
+from app.config import settings
+from app.services import batch_identification
+from app.services.batch_identification import BatchIdentificationJob, JsonlResultWriter
+
+class _Interrupted(BaseException):
+    """Not an Exception, so it stops the job instead of becoming an error record"""
+
+class _FaceService:
+    def __init__(self, fail_on=None):
+        self.engine = types.SimpleNamespace(workers=1)
+        self.fail_on = fail_on
+
+    async def analyze_image_files(self, paths):
+        if self.fail_on in paths:
+            raise _Interrupted()
+        return [([((0, 10, 10, 0), np.ones(128, dtype=np.float32), None)], None) for _ in paths]
+
+async def _no_match(encodings):
+    return [None] * len(encodings)
+
+@pytest.fixture
+def images(tmp_path):
+    folder = tmp_path / "images"
+    folder.mkdir()
+    paths = []
+    for name in "abcde":
+        path = folder / f"{name}.jpg"
+        path.write_bytes(b"")
+        paths.append(str(path))
+    return paths
+
+@pytest.fixture
+def job_settings(monkeypatch):
+    monkeypatch.setattr(settings, "matcher_backend", "pgvector")
+    monkeypatch.setattr(settings, "batch_images_per_task", 1)
+    monkeypatch.setattr(settings, "batch_lookup_size", 1)
+    monkeypatch.setattr(settings, "batch_checkpoint_interval_seconds", 0)
+
+def _job(face_service, images, output, **kwargs):
+    job = BatchIdentificationJob(face_service, [os.path.dirname(images[0])], output, **kwargs)
+    job._search = _no_match
+    return job
+
+def test_writer_resume_drops_records_after_checkpoint(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    writer = JsonlResultWriter(path)
+    writer.write([{"n": 1}])
+    position = writer.flush()
+    writer.write([{"n": 2}])
+    writer.close()
+
+    writer = JsonlResultWriter(path, position)
+    writer.write([{"n": 3}])
+    writer.close()
+    with open(path) as f:
+        assert [json.loads(line)["n"] for line in f] == [1, 3]
+
+def test_writer_refuses_missing_output(tmp_path):
+    with pytest.raises(ValueError, match="--restart"):
+        JsonlResultWriter(str(tmp_path / "gone.jsonl"), position=10)
+
+def test_video_segments(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "batch_video_segment_frames", 100)
+    monkeypatch.setattr(batch_identification, "discover_files", lambda sources: iter(["/v/clip.mp4", "/v/stream.mkv"]))
+    monkeypatch.setattr(batch_identification, "video_info",
+                        lambda path: (250, 30.0) if path.endswith(".mp4") else (None, 25.0))
+    job = BatchIdentificationJob(None, ["/v"], str(tmp_path / "out.jsonl"), sample_fps=2)
+    tasks = list(job.tasks())
+    assert [(task.start, task.stop, task.step) for task in tasks] == [
+        (0, 100, 15), (100, 200, 15), (200, None, 15),  # the last segment reads to the end
+        (0, None, 12),
+    ]
+    assert len({task.key for task in tasks}) == 4
+
+def test_resume_after_interruption_writes_every_record_once(tmp_path, images, job_settings):
+    output = str(tmp_path / "out.jsonl")
+    with pytest.raises(_Interrupted):
+        asyncio.run(_job(_FaceService(fail_on=images[3]), images, output).run())
+    with open(output + ".checkpoint.json") as f:
+        assert 0 < len(json.load(f)["done"]) < len(images)
+
+    counts = asyncio.run(_job(_FaceService(), images, output).run())
+    with open(output) as f:
+        sources = [json.loads(line)["source"] for line in f]
+    assert sorted(sources) == images
+    assert counts["tasks"] == len(images)
+    assert counts["faces"] == len(images)
+
+def test_checkpoint_from_other_sources_refused(tmp_path, images, job_settings):
+    output = str(tmp_path / "out.jsonl")
+    asyncio.run(_job(_FaceService(), images, output).run())
+    other = BatchIdentificationJob(_FaceService(), [images[0]], output)
+    with pytest.raises(ValueError, match="other sources"):
+        asyncio.run(other.run())
+
+def test_restart_ignores_checkpoint(tmp_path, images, job_settings):
+    output = str(tmp_path / "out.jsonl")
+    asyncio.run(_job(_FaceService(), images, output).run())
+    counts = asyncio.run(_job(_FaceService(), images, output, restart=True).run())
+    assert counts["tasks"] == len(images)
+    with open(output) as f:
+        assert len(f.readlines()) == len(images)
@@ -0,0 +1,175 @@
+import multiprocessing
+import socket
+import socketserver
+import threading
+import time
+import pytest
+from app.services.cache_backends import MemoryCacheBackend, RespCacheBackend, SharedMemoryCacheBackend
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    """Just enough of the Redis protocol for RespCacheBackend: GET, SET ... PX, DEL, SCAN"""
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _bulk(self, value):
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            command = args[0].upper()
+            if command == b"GET":
+                reply = self._bulk(store.get(args[1]))
+            elif command == b"SET":
+                store[args[1]] = args[2]
+                reply = b"+OK\r\n"
+            elif command == b"DEL":
+                reply = b":%d\r\n" % sum(store.pop(key, None) is not None for key in args[1:])
+            elif command == b"SCAN":
+                prefix = args[3].rstrip(b"*")
+                keys = [key for key in store if key.startswith(prefix)]
+                reply = b"*2\r\n$1\r\n0\r\n*%d\r\n" % len(keys) + b"".join(self._bulk(key) for key in keys)
+            else:
+                reply = b"-ERR unknown command\r\n"
+            self.wfile.write(reply)
+
+class _RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def test_memory_sweep_with_mixed_ttls():
+    backend = MemoryCacheBackend(max_size=4, sweep_interval_seconds=3600)
+    backend.set("long", 1, ttl_seconds=60)
+    backend.set("short", 2, ttl_seconds=0.01)
+    time.sleep(0.02)
+    backend.sweep()
+    assert backend.size() == 1
+    assert backend.stats()["expirations"] == 1
+    assert backend.get("long") == 1
+
+@pytest.fixture
+def resp_server():
+    server = _RespServer(("127.0.0.1", 0), _RespHandler)
+    server.store = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_resp_hit_and_miss(resp_server):
+    host, port = resp_server.server_address
+    backend = RespCacheBackend(f"redis://{host}:{port}/0", prefix="test:", timeout_seconds=1.0)
+    assert backend.get("missing") is None
+    backend.set("key", b"\x00value\r\n", ttl_seconds=60)
+    assert resp_server.store[b"test:key"] == b"\x00value\r\n"
+    assert backend.get("key") == b"\x00value\r\n"
+    assert backend.size() == 1
+    backend.delete("key")
+    assert backend.get("key") is None
+    stats = backend.stats()
+    assert (stats["hits"], stats["misses"], stats["errors"]) == (1, 2, 0)
+
+def test_resp_unreachable_reads_as_miss_and_backs_off():
+    backend = RespCacheBackend(f"redis://127.0.0.1:{_unused_port()}/0", timeout_seconds=0.2,
+                               retry_seconds=0.1, max_retry_seconds=0.4)
+    assert backend.get("key") is None
+    backend.set("key", b"value", ttl_seconds=60)
+    # The circuit is open: the second call never reached the network
+    assert backend.errors == 1
+    assert backend.stats()["circuit_open"]
+    time.sleep(0.15)
+    assert backend.get("key") is None
+    assert backend.errors == 2
+    assert backend._backoff == 0.4
+
+def test_resp_recovers_after_backoff(resp_server):
+    host, port = resp_server.server_address
+    backend = RespCacheBackend(f"redis://{host}:{port}/0", timeout_seconds=1.0, retry_seconds=0.05)
+    backend.set("key", b"value", ttl_seconds=60)
+    backend._close()
+    backend._retry_at = time.monotonic() + 0.05
+    assert backend.get("key") is None
+    time.sleep(0.06)
+    assert backend.get("key") == b"value"
+    assert not backend.circuit_open
+
+@pytest.fixture
+def shm_path(tmp_path):
+    return str(tmp_path / "cache")
+
+def test_shm_ttl(shm_path):
+    backend = SharedMemoryCacheBackend(shm_path, max_size=16, slot_bytes=128)
+    backend.set("short", b"a", ttl_seconds=0.05)
+    backend.set("long", b"b", ttl_seconds=60)
+    assert backend.get("short") == b"a"
+    time.sleep(0.06)
+    assert backend.get("short") is None
+    assert backend.get("long") == b"b"
+    assert backend.expirations == 1
+    assert backend.size() == 1
+
+def test_shm_evicts_least_recently_used(shm_path):
+    # One set of eight ways, so every key competes for the same slots
+    backend = SharedMemoryCacheBackend(shm_path, max_size=8, slot_bytes=128)
+    for i in range(8):
+        backend.set(f"k{i}", b"v", ttl_seconds=60)
+    assert backend.evictions == 0
+    backend.get("k0")
+    backend.set("k8", b"v", ttl_seconds=60)
+    assert backend.evictions == 1
+    assert backend.get("k1") is None
+    assert backend.get("k0") == b"v"
+    assert backend.get("k8") == b"v"
+
+def test_shm_reuses_expired_slot_without_eviction(shm_path):
+    backend = SharedMemoryCacheBackend(shm_path, max_size=8, slot_bytes=128)
+    for i in range(7):
+        backend.set(f"k{i}", b"v", ttl_seconds=60)
+    backend.set("k7", b"v", ttl_seconds=0.01)
+    time.sleep(0.02)
+    backend.set("k8", b"v", ttl_seconds=60)
+    assert backend.evictions == 0
+    assert backend.size() == 8
+
+def test_shm_skips_oversized_entries(shm_path):
+    backend = SharedMemoryCacheBackend(shm_path, max_size=8, slot_bytes=64)
+    backend.set("big", b"x" * 64, ttl_seconds=60)
+    assert backend.get("big") is None
+    assert backend.oversized == 1
+
+def test_shm_refuses_other_layout(shm_path):
+    backend = SharedMemoryCacheBackend(shm_path, max_size=64, slot_bytes=128)
+    backend.set("key", b"value", ttl_seconds=60)
+    with pytest.raises(ValueError, match="another layout"):
+        SharedMemoryCacheBackend(shm_path, max_size=128, slot_bytes=64)
+    with pytest.raises(ValueError, match="another layout"):
+        SharedMemoryCacheBackend(shm_path, max_size=256, slot_bytes=128)
+    assert backend.get("key") == b"value"
+
+def _write_entry(path: str) -> None:
+    SharedMemoryCacheBackend(path, max_size=16, slot_bytes=128).set("from-child", b"hello", ttl_seconds=60)
+
+def test_shm_visible_across_processes(shm_path):
+    backend = SharedMemoryCacheBackend(shm_path, max_size=16, slot_bytes=128)
+    child = multiprocessing.get_context("spawn").Process(target=_write_entry, args=(shm_path,))
+    child.start()
+    child.join(30)
+    assert child.exitcode == 0
+    assert backend.get("from-child") == b"hello"
@@ -0,0 +1,81 @@
+import sys
+import types
+import numpy as np
+import pytest
+from app.services.face_quality import QualityThresholds, assess_faces
+
+pytest.importorskip("cv2")
+
+THRESHOLDS = QualityThresholds(
+    min_face_size=40, min_sharpness=50.0, min_brightness=40.0, max_brightness=220.0,
+    max_yaw=0.35, max_roll_degrees=25.0
+)
+FACE = (0, 100, 100, 0)
+
+def _frontal(location):
+    top, right, bottom, left = location
+    return {
+        "left_eye": [(left + 30, top + 40), (left + 40, top + 40)],
+        "right_eye": [(left + 60, top + 40), (left + 70, top + 40)],
+        "nose_tip": [(left + 50, top + 60)],
+    }
+
+@pytest.fixture
+def landmarks(monkeypatch):
+    """Stands in for face_recognition.face_landmarks; tests may replace ``landmarks.make``"""
+    module = types.SimpleNamespace(make=_frontal, calls=0)
+
+    def face_landmarks(image, locations, model="large"):
+        assert model == "small"
+        module.calls += 1
+        return [module.make(location) for location in locations]
+
+    monkeypatch.setitem(sys.modules, "face_recognition", types.SimpleNamespace(face_landmarks=face_landmarks))
+    return module
+
+def _textured(low: int = 60, high: int = 200) -> np.ndarray:
+    return np.random.default_rng(0).integers(low, high, size=(100, 100, 3), dtype=np.uint8)
+
+def test_sharp_frontal_face_passes(landmarks):
+    assert assess_faces(_textured(), [FACE], THRESHOLDS) == [None]
+
+def test_small_face(landmarks):
+    assert assess_faces(_textured(), [(0, 30, 30, 0)], THRESHOLDS) == ["size"]
+    assert landmarks.calls == 0
+
+def test_dark_and_overexposed_faces(landmarks):
+    assert assess_faces(_textured(0, 20), [FACE], THRESHOLDS) == ["brightness"]
+    assert assess_faces(_textured(235, 256), [FACE], THRESHOLDS) == ["brightness"]
+
+def test_blurred_face(landmarks):
+    flat = np.full((100, 100, 3), 128, dtype=np.uint8)
+    assert assess_faces(flat, [FACE], THRESHOLDS) == ["blur"]
+
+def test_turned_face(landmarks):
+    def turned(location):
+        points = _frontal(location)
+        points["nose_tip"] = [(location[3] + 75, location[0] + 60)]
+        return points
+
+    landmarks.make = turned
+    assert assess_faces(_textured(), [FACE], THRESHOLDS) == ["pose"]
+
+def test_tilted_face(landmarks):
+    def tilted(location):
+        top, _, _, left = location
+        return {
+            "left_eye": [(left + 30, top + 30), (left + 40, top + 35)],
+            "right_eye": [(left + 60, top + 45), (left + 70, top + 50)],
+            "nose_tip": [(left + 45, top + 60)],
+        }
+
+    landmarks.make = tilted
+    assert assess_faces(_textured(), [FACE], THRESHOLDS) == ["pose"]
+
+def test_landmarks_only_for_faces_that_passed(landmarks):
+    image = np.zeros((100, 300, 3), dtype=np.uint8)
+    image[:, :100] = _textured()
+    image[:, 200:] = _textured()
+    faces = [FACE, (0, 300, 100, 200), (0, 130, 20, 110)]
+    assert assess_faces(image, faces, THRESHOLDS) == [None, None, "size"]
+    assert landmarks.calls == 1
@@ -0,0 +1,60 @@
+from app.services.face_tracker import FaceTracker, centroid_distance, iou
+
+def test_iou():
+    assert iou((0, 10, 10, 0), (0, 10, 10, 0)) == 1.0
+    assert iou((0, 10, 10, 0), (0, 20, 10, 10)) == 0.0
+    assert iou((0, 10, 10, 0), (0, 15, 10, 5)) == 50 / 150
+
+def test_centroid_distance_of_degenerate_box():
+    # Crossed-over edges: a negative area must not turn the distance into NaN
+    assert centroid_distance((10, 10, 0, 0), (10, 10, 0, 0)) == 0.0
+    assert centroid_distance((10, 10, 0, 0), (10, 13, 0, 3)) == 3.0
+
+def test_moving_face_keeps_its_track():
+    tracker = FaceTracker()
+    tracks, _ = tracker.update([(100, 150, 150, 100)], frame_index=0)
+    track_id = tracks[0].track_id
+    for frame in range(1, 5):
+        shift = 10 * frame
+        tracks, dropped = tracker.update([(100, 150 + shift, 150, 100 + shift)], frame_index=frame)
+        assert [track.track_id for track in tracks] == [track_id]
+        assert dropped == []
+
+def test_propagate_follows_velocity():
+    tracker = FaceTracker()
+    tracker.update([(100, 150, 150, 100)], frame_index=0)
+    tracker.update([(100, 160, 150, 110)], frame_index=1)
+    track = tracker.propagate(frame_index=3)[0]
+    # Velocity is smoothed: half of the observed 10 px/frame after one step
+    assert track.bbox == (100, 170, 150, 120)
+
+def test_fast_small_face_matches_on_centroid():
+    tracker = FaceTracker(iou_threshold=0.3, max_centroid_distance=0.5)
+    tracks, _ = tracker.update([(100, 120, 120, 100)], frame_index=0)
+    track_id = tracks[0].track_id
+    # Too little overlap, but the centre moved less than half the box size
+    tracks, _ = tracker.update([(107, 127, 127, 107)], frame_index=1)
+    assert iou((100, 120, 120, 100), (107, 127, 127, 107)) < 0.3
+    assert [track.track_id for track in tracks] == [track_id]
+
+def test_unmatched_track_dropped_after_max_missed():
+    tracker = FaceTracker(max_missed=2)
+    tracks, _ = tracker.update([(0, 50, 50, 0)], frame_index=0)
+    track_id = tracks[0].track_id
+    for frame in (1, 2):
+        tracks, dropped = tracker.update([], frame_index=frame)
+        assert len(tracks) == 1 and dropped == []
+    tracks, dropped = tracker.update([], frame_index=3)
+    assert tracks == []
+    assert [track.track_id for track in dropped] == [track_id]
+
+def test_new_face_gets_new_track():
+    tracker = FaceTracker()
+    tracker.update([(0, 50, 50, 0)], frame_index=0)
+    tracks, _ = tracker.update([(0, 50, 50, 0), (300, 400, 400, 300)], frame_index=1)
+    assert len({track.track_id for track in tracks}) == 2
+
+def test_track_ids_unique_across_trackers():
+    first, _ = FaceTracker().update([(0, 50, 50, 0)], frame_index=0)
+    second, _ = FaceTracker().update([(0, 50, 50, 0)], frame_index=0)
+    assert first[0].track_id != second[0].track_id
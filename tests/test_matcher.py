@@ -0,0 +1,61 @@
+import asyncio
+import numpy as np
+from app.services import matcher_service
+from app.services.matcher_service import EmbeddingMatcher
+
+def _vector(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(128).astype(np.float32)
+
+def test_empty_gallery():
+    matcher = EmbeddingMatcher()
+    assert matcher.match([]) == []
+    assert matcher.match([_vector(0)]) == [[]]
+
+def test_best_matches_first_above_threshold():
+    matcher = EmbeddingMatcher()
+    for i in range(10):
+        matcher.add(f"u{i}", f"user {i}", "555", _vector(i))
+    near = _vector(3) + 0.1 * _vector(100)
+    results = matcher.match([near, _vector(7) * 5.0], threshold=0.5, limit=3)
+    assert [match["user_id"] for match in results[0]] == ["u3"]
+    assert results[0][0]["similarity"] > 0.99
+    # Scale does not matter: rows and queries are normalised
+    assert results[1][0]["user_id"] == "u7"
+    assert abs(results[1][0]["similarity"] - 1.0) < 1e-5
+
+def test_limit_and_order():
+    matcher = EmbeddingMatcher()
+    base = _vector(0)
+    for i in range(6):
+        matcher.add(f"u{i}", "n", "p", base + 0.2 * i * _vector(50 + i))
+    matches = matcher.match([base], threshold=-1.0, limit=3)[0]
+    assert [match["user_id"] for match in matches] == ["u0", "u1", "u2"]
+    assert matches == sorted(matches, key=lambda match: -match["similarity"])
+
+def test_add_grows_past_initial_capacity():
+    matcher = EmbeddingMatcher(initial_capacity=2)
+    for i in range(5):
+        matcher.add(f"u{i}", "n", "p", _vector(i))
+    assert len(matcher) == 5
+    assert matcher.match([_vector(4)], limit=1)[0][0]["user_id"] == "u4"
+
+def test_load_replaces_gallery(monkeypatch):
+    rows = [
+        {"user_id": f"u{i}", "name": f"user {i}", "phone_number": "555", "embedding": _vector(i)}
+        for i in range(3)
+    ]
+
+    class _Repository:
+        def __init__(self, session):
+            pass
+
+        async def get_all_embeddings_with_users(self):
+            return rows
+
+    monkeypatch.setattr(matcher_service, "FaceEmbeddingRepository", _Repository)
+    matcher = EmbeddingMatcher()
+    matcher.add("stale", "n", "p", _vector(99))
+    assert asyncio.run(matcher.load(session=None)) == 3
+    assert matcher.loaded
+    assert matcher.match([_vector(99)], threshold=0.9) == [[]]
+    assert matcher.match([_vector(2)], limit=1)[0][0]["name"] == "user 2"
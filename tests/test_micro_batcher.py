@@ -0,0 +1,50 @@
+import asyncio
+from app.services.recognition_service import MicroBatcher
+
+def _recording_handler(calls):
+    async def handler(items):
+        calls.append(list(items))
+        return [item * 10 for item in items]
+    return handler
+
+def test_flushes_when_full():
+    calls = []
+
+    async def scenario():
+        batcher = MicroBatcher("test", _recording_handler(calls), max_size=3, max_delay=60.0)
+        return await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(3))), 1.0)
+
+    assert asyncio.run(scenario()) == [0, 10, 20]
+    assert calls == [[0, 1, 2]]
+
+def test_flushes_after_delay():
+    calls = []
+
+    async def scenario():
+        batcher = MicroBatcher("test", _recording_handler(calls), max_size=100, max_delay=0.01)
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2))
+
+    assert asyncio.run(scenario()) == [10, 20]
+    assert calls == [[1, 2]]
+
+def test_overflow_starts_next_batch():
+    calls = []
+
+    async def scenario():
+        batcher = MicroBatcher("test", _recording_handler(calls), max_size=2, max_delay=0.01)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert asyncio.run(scenario()) == [0, 10, 20, 30, 40]
+    assert calls == [[0, 1], [2, 3], [4]]
+
+def test_handler_error_reaches_every_caller():
+    async def failing(items):
+        raise RuntimeError("engine down")
+
+    async def scenario():
+        batcher = MicroBatcher("test", failing, max_size=2, max_delay=60.0)
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [type(result) for result in results] == [RuntimeError, RuntimeError]
+    assert str(results[0]) == "engine down"
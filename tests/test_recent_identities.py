@@ -0,0 +1,98 @@
+import time
+import zlib
+import numpy as np
+import pytest
+from app.services.cache_backends import SharedMemoryCacheBackend
+from app.services.cache_service import CacheService
+from app.services.recent_identities import MATCH_CODEC, RecentIdentityCache, pack_match, unpack_match
+
+def _vector(seed: int) -> np.ndarray:
+    vector = np.random.default_rng(seed).standard_normal(128).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+def _match(user_id: str) -> dict:
+    return {"user_id": user_id, "name": f"name {user_id}", "phone_number": "555", "similarity": 0.9}
+
+def _nudge(vector: np.ndarray, seed: int, distance: float) -> np.ndarray:
+    """A unit vector about ``distance`` (cosine) away from ``vector``"""
+    noise = _vector(seed)
+    noise -= (noise @ vector) * vector
+    noise /= np.linalg.norm(noise)
+    angle = np.arccos(1.0 - distance)
+    return (np.cos(angle) * vector + np.sin(angle) * noise).astype(np.float32)
+
+@pytest.fixture
+def shared(tmp_path):
+    backend = SharedMemoryCacheBackend(str(tmp_path / "cache"), max_size=256, slot_bytes=512)
+    return CacheService(backend=backend, codec=MATCH_CODEC, ttl_seconds=60)
+
+def test_pack_round_trip():
+    entry = unpack_match(pack_match({**_match("u1"), "embedding": _vector(1)}))
+    assert entry["user_id"] == "u1" and entry["name"] == "name u1" and entry["phone_number"] == "555"
+    assert entry["similarity"] == pytest.approx(0.9)
+    assert np.allclose(entry["embedding"], _vector(1), atol=1e-3)
+
+def test_near_duplicate_hits_and_far_misses():
+    cache = RecentIdentityCache(tolerance=0.03)
+    cache.remember([_vector(1)], [_match("u1")])
+    hit, miss = cache.lookup([_nudge(_vector(1), 2, 0.01), _nudge(_vector(1), 2, 0.1)])
+    assert hit == _match("u1")
+    assert miss is None
+
+def test_unknown_faces_not_cached():
+    cache = RecentIdentityCache()
+    cache.remember([_vector(1)], [None])
+    assert cache.size() == 0
+    assert cache.lookup([_vector(1)]) == [None]
+
+def test_entries_expire():
+    cache = RecentIdentityCache(ttl_seconds=0.01)
+    cache.remember([_vector(1)], [_match("u1")])
+    time.sleep(0.02)
+    assert cache.lookup([_vector(1)]) == [None]
+    assert cache.size() == 0
+
+def test_oldest_entry_replaced_when_full():
+    cache = RecentIdentityCache(max_size=2)
+    cache.remember([_vector(i) for i in range(3)], [_match(f"u{i}") for i in range(3)])
+    assert cache.lookup([_vector(0), _vector(1), _vector(2)]) == [None, _match("u1"), _match("u2")]
+
+def test_shared_between_workers(shared):
+    first = RecentIdentityCache(shared=shared)
+    second = RecentIdentityCache(shared=shared)
+    first.remember([_vector(1)], [_match("u1")])
+    assert second.lookup([_nudge(_vector(1), 2, 0.01)]) == [_match("u1")]
+    # The shared hit is now cached locally as well
+    assert second.size() == 1
+
+def test_users_sharing_a_bucket_keep_their_own_slots(shared):
+    # One hyperplane: half of all embeddings land in the same bucket
+    first = RecentIdentityCache(shared=shared, lsh_bits=1, bucket_entries=4, lsh_probes=0)
+    second = RecentIdentityCache(shared=shared, lsh_bits=1, bucket_entries=4, lsh_probes=0)
+    bucket = first._buckets(_vector(1))[0]
+    seeds = [seed for seed in range(2, 50) if first._buckets(_vector(seed))[0] == bucket]
+    users = {}
+    for seed in [1] + seeds:
+        user_id = f"u{seed}"
+        slot = zlib.crc32(user_id.encode()) % 4
+        users.setdefault(slot, (seed, user_id))
+    assert len(users) >= 2
+    for seed, user_id in users.values():
+        first.remember([_vector(seed)], [_match(user_id)])
+    for seed, user_id in users.values():
+        assert second.lookup([_vector(seed)]) == [_match(user_id)]
+
+def test_lookup_probes_neighbouring_bucket(shared):
+    writer = RecentIdentityCache(shared=shared)
+    vector = _vector(1)
+    projections = writer._planes @ vector
+    closest = int(np.argmin(np.abs(projections)))
+    plane = writer._planes[closest]
+    # Push the query just across the hyperplane nearest to it
+    query = vector - (projections[closest] * 1.01) * plane / (plane @ plane)
+    assert writer._buckets(query)[0] == writer._buckets(vector)[0] ^ (1 << closest)
+    assert 1.0 - float(query @ vector / np.linalg.norm(query)) < 0.03
+
+    writer.remember([vector], [_match("u1")])
+    assert RecentIdentityCache(shared=shared, lsh_probes=0).lookup([query]) == [None]
+    assert RecentIdentityCache(shared=shared, lsh_probes=1).lookup([query]) == [_match("u1")]